@@ -0,0 +1,264 @@
+'''
+Optional asyncio transport built on asyncssh, same command list and prompt
+handling as generic.execute so one process can keep thousands of sessions.
+Select it with TRANSPORT = 'asyncssh' in settings, the sync functions in
+generic then run these coroutines on one event loop and one connection per
+router, kept for the whole workflow like the paramiko connection pool.
+'''
+import os
+import time
+import asyncio
+import threading
+import functools
+import contextlib
+import contextvars
+import settings
+import generic
+import fleet
+import metrics
+import logging
+logger = logging.getLogger()
+
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class SyncSession:
+    '''
+    Event loop and asyncssh connection of one router for the sync transport
+    functions, the connection is opened on first use and again once closed
+    '''
+    def __init__(self, host):
+        self.host = host
+        self.loop = asyncio.new_event_loop()
+        self.connection = None
+        self.lock = threading.Lock()
+
+    async def _run(self, function, args, kwargs):
+        if self.connection is None or self.connection.is_closed():
+            self.connection = await connect(self.host)
+        return await function(*args, connection=self.connection, **kwargs)
+
+    def run(self, function, *args, **kwargs):
+        '''
+        Result of the coroutine function(*args, connection=connection, **kwargs)
+        '''
+        with self.lock:
+            return self.loop.run_until_complete(self._run(function, args, kwargs))
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.loop.run_until_complete(self.connection.wait_closed())
+                self.connection = None
+            self.loop.close()
+
+
+class SessionPool:
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._sessions[host] = SyncSession(host)
+            return session
+
+    def close(self, host):
+        with self._lock:
+            session = self._sessions.pop(host, None)
+        if session is not None:
+            session.close()
+
+    def close_all(self):
+        with self._lock:
+            hosts = list(self._sessions)
+        for host in hosts:
+            self.close(host)
+
+_session_pool = SessionPool()
+
+def run_sync(host, function, *args, **kwargs):
+    return _session_pool.get(host).run(function, *args, **kwargs)
+
+def close_session(host):
+    _session_pool.close(host)
+
+def close_sessions():
+    _session_pool.close_all()
+
+
+async def to_thread(function, *args):
+    '''
+    function(*args) in the default thread pool with the current context, for
+    blocking work such as YAML loading that would stall every other session
+    '''
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(contextvars.copy_context().run, function, *args))
+
+
+async def connect(host):
+    if asyncssh is None:
+        raise RuntimeError('asyncssh is not installed, run "pip install asyncssh" to use the asyncio transport')
+    options = {}
+    if hasattr(settings, 'USERNAME'):
+        options['username'] = settings.USERNAME
+    if hasattr(settings, 'IDENTITYFILE'):
+        options['client_keys'] = [settings.IDENTITYFILE]
+    # host keys are checked like ssh does: ~/.ssh/known_hosts or the
+    # UserKnownHostsFile of the ssh config unless SSH_KNOWN_HOSTS is set
+    if settings.SSH_KNOWN_HOSTS:
+        options['known_hosts'] = os.path.expanduser(settings.SSH_KNOWN_HOSTS)
+    with metrics.timed('ssh_connect', host=host):
+        return await asyncssh.connect(host,
+                                      config=[os.path.expanduser(settings.SSH_CONFIG)],
+                                      agent_forwarding=True,
+                                      connect_timeout=60,
+                                      keepalive_interval=60,
+                                      **options)
+
+
+async def run_commands(process, data, cmd_list, prompt, sink=None):
+    '''
+    asyncio version of generic.run_commands on an asyncssh shell process
+    '''
+    return_output = []
+    line = generic.line_gen(cmd_list)
+    cmd = None
+    last_line = ''
+    matcher = generic.get_error_matcher(data)
+    deadline = generic.get_command_deadline(data)
+    command_start = time.monotonic()
+    command_bytes = 0
+    while True:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise generic.CommandTimeout('{0}: no prompt after {1!r} within {2}s'.format(
+                data['router_hostname'], cmd, settings.COMMAND_TIMEOUT))
+        try:
+            router_output = await asyncio.wait_for(process.stdout.read(99999), timeout)
+        except asyncio.TimeoutError:
+            continue
+        if not router_output:
+            raise EOFError('{0}: channel closed after {1!r}'.format(data['router_hostname'], cmd))
+        command_bytes += len(router_output)
+        if sink is None:
+            return_output.append(router_output)
+        else:
+            sink(router_output)
+        generic.check_for_errors(router_output, data, cmd, matcher)
+        logger.info('%s', generic.DeviceOutput(data['router_hostname'], router_output))
+        last_line = (last_line + router_output).rsplit('\n', 1)[-1]
+        if generic.is_prompt(last_line, prompt):
+            metrics.record('command', time.monotonic() - command_start, command=cmd, bytes=command_bytes)
+            try:
+                cmd = next(line)
+            except StopIteration:
+                break
+            process.stdin.write(cmd + '\n')
+            last_line = ''
+            deadline = generic.get_command_deadline(data)
+            command_start = time.monotonic()
+            command_bytes = 0
+    return ''.join(return_output)
+
+
+async def execute(data, cmd_list, connection=None, sink=None):
+    prompt = generic.get_prompt(data)
+    own_connection = connection is None
+    if own_connection:
+        connection = await connect(data['router_hostname'])
+    try:
+        process = await connection.create_process(term_type='xterm')
+        try:
+            return await run_commands(process, data, cmd_list, prompt, sink)
+        finally:
+            process.close()
+    finally:
+        if own_connection:
+            connection.close()
+
+
+async def scp_rendered_config(data, config_file, remote_file_patch, connection=None):
+    own_connection = connection is None
+    if own_connection:
+        connection = await connect(data['router_hostname'])
+    try:
+        with metrics.timed('scp', bytes=os.path.getsize(config_file)):
+            await asyncssh.scp(config_file, (connection, remote_file_patch))
+    except asyncssh.SFTPError as error:
+        logger.error(error)
+        raise error
+    finally:
+        if own_connection:
+            connection.close()
+
+
+async def get_config_from_router(data, connection=None, config_file=None):
+    cmd_list, regex_running_search = generic.get_config_commands(data)
+    with metrics.timed('config_fetch') as fields:
+        if config_file is not None:
+            part_file = config_file + '.part'
+            try:
+                with open(part_file, 'wb') as outfile:
+                    capture = generic.ConfigCapture(outfile, *generic.get_capture_patterns(data))
+                    await execute(data, cmd_list, connection, sink=capture.feed)
+                    fields['bytes'] = capture.close()
+                os.replace(part_file, config_file)
+            finally:
+                # also when the router timeout cancels the task
+                if os.path.exists(part_file):
+                    os.remove(part_file)
+            return config_file
+        router_output = await execute(data, cmd_list, connection)
+        router_configuration = regex_running_search.search(router_output)
+        fields['bytes'] = len(router_configuration.group(0))
+        return ''.join(router_configuration.group(0))
+
+
+async def run_fleet(function, routers, limit=None, os_limits=None, site_limits=None, timeout=None):
+    '''
+    Await function(router_data) for every router with at most limit sessions
+    open at once, the per-OS / per-site caps and the per-router timeout of
+    fleet.FleetRunner, returns fleet.RouterResult in the order of routers
+    '''
+    semaphore = asyncio.Semaphore(limit or settings.ASYNC_MAX_SESSIONS)
+    timeout = timeout if timeout is not None else settings.ROUTER_TIMEOUT
+    os_limits = os_limits if os_limits is not None else settings.FLEET_OS_LIMITS
+    site_limits = site_limits if site_limits is not None else settings.FLEET_SITE_LIMITS
+    caps = {('router_os', name): asyncio.Semaphore(max(limit, 1)) for name, limit in os_limits.items()}
+    caps.update({('site', name): asyncio.Semaphore(max(limit, 1)) for name, limit in site_limits.items()})
+
+    async def run_router(router_data):
+        # caps are taken in the same order by every router and before the
+        # session, a router waiting for its site holds no session
+        slots = [slot for slot in (('router_os', router_data.get('router_os')), ('site', router_data.get('site')))
+                 if slot in caps]
+        async with contextlib.AsyncExitStack() as stack:
+            for slot in slots:
+                await stack.enter_async_context(caps[slot])
+            await stack.enter_async_context(semaphore)
+            metrics.set_router(router_data['router_hostname'])
+            start = time.monotonic()
+            try:
+                output = await asyncio.wait_for(function(router_data), timeout or None)
+                return fleet.RouterResult(router_data['router_hostname'], 'ok', output, None,
+                                          time.monotonic() - start)
+            except asyncio.TimeoutError:
+                return fleet.RouterResult(router_data['router_hostname'], 'timeout', None,
+                                          'no result after {0}s'.format(timeout), time.monotonic() - start)
+            except Exception as error:
+                logger.exception(router_data['router_hostname'])
+                return fleet.RouterResult(router_data['router_hostname'], 'failed', None, error,
+                                          time.monotonic() - start)
+
+    return await asyncio.gather(*(run_router(router_data) for router_data in routers))
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+'''
+Local SSH/SCP server that plays IOS-XR, Huawei VRP and Junos devices well
+enough for get_config_from_router, get_diff_from_router and
+push_config_to_router. The device is picked by the SSH user name, every
+answer waits latency seconds like a real control plane would.
+
+    python bench/fakedevice.py --port 2222 --latency 0.05 r1:iosxr r2:huawei
+'''
+import os
+import time
+import shlex
+import socket
+import argparse
+import threading
+import paramiko
+import logging
+# clients hang up without a goodbye, paramiko would report every one of them
+logging.getLogger('fakedevice.transport').setLevel(logging.CRITICAL)
+
+RUNNING_HEADER = {
+    'iosxr': 'Building configuration...\n!! IOS XR Configuration 6.5.3\n!! Last configuration change by pnba\n',
+    'huawei': '!Software Version V800R011C00SPC607B607\n!Last configuration was updated by pnba\n#\n',
+    'junos': '## Last commit: 2026-01-01 00:00:00 UTC by pnba\nversion 18.4R3;\n',
+}
+
+DEFAULT_CONFIG = {
+    'iosxr': 'hostname {0}\n!\nend\n',
+    'huawei': 'sysname {0}\n#\nreturn\n',
+    'junos': 'system {{\n    host-name {0};\n}}\n',
+}
+
+
+class FakeDevice:
+    '''
+    CLI state of one router: mode, running config, uploaded files, candidate
+    '''
+    def __init__(self, hostname, router_os, config=None):
+        self.hostname = hostname
+        self.router_os = router_os
+        self.running = config if config is not None else DEFAULT_CONFIG[router_os].format(hostname)
+        self.files = {}
+        self.candidate = None
+        self.configure = False
+        self.confirm = None
+        self.lock = threading.Lock()
+
+    def prompt(self):
+        if self.router_os == 'iosxr':
+            return 'RP/0/RSP0/CPU0:{0}{1}#'.format(self.hostname, '(config)' if self.configure else '')
+        if self.router_os == 'huawei':
+            return '[~{0}]'.format(self.hostname) if self.configure else '<{0}>'.format(self.hostname)
+        return 'pnba@{0}{1}'.format(self.hostname, '#' if self.configure else '>')
+
+    def load(self, path):
+        path = os.path.basename(path.split(':', 1)[-1])
+        if path not in self.files:
+            return 'Error: file {0} not found\n'.format(path)
+        self.candidate = self.files[path]
+        return ''
+
+    def show(self, config):
+        config = config or ''
+        if config and not config.endswith('\n'):
+            config += '\n'
+        return RUNNING_HEADER[self.router_os] + config
+
+    def handle(self, command):
+        '''
+        Output of command without the echo and the prompt, None when the
+        device asks a question instead of showing the prompt
+        '''
+        with self.lock:
+            return self._handle(command.strip())
+
+    def _handle(self, command):
+        if self.confirm is not None:
+            action, self.confirm = self.confirm, None
+            if command.lower() in ('y', 'yes'):
+                return action()
+            return ''
+        words = command.split()
+        if not words:
+            return ''
+        if self.router_os == 'iosxr':
+            if command in ('conf t', 'configure terminal', 'configure'):
+                self.configure = True
+            elif command in ('end', 'exit'):
+                self.configure = False
+            elif words[0] == 'load':
+                return self.load(words[-1]) or 'Loading.\n{0} bytes parsed in 1 sec\n'.format(len(self.candidate))
+            elif command == 'show configuration':
+                return self.show(self.candidate)
+            elif command in ('sh run', 'show running-config'):
+                return self.show(self.running)
+            elif command.startswith('commit replace'):
+                self.confirm = self.commit
+                return None
+            elif command == 'commit':
+                return self.commit()
+            elif command != 'terminal length 0':
+                return "% Invalid input detected at '^' marker.\n"
+        elif self.router_os == 'huawei':
+            if command in ('sys', 'system-view'):
+                self.configure = True
+                return 'Enter system view, return user view with return command.\n'
+            elif command in ('return', 'quit'):
+                self.configure = False
+            elif command.startswith('load configuration file'):
+                return self.load(words[3])
+            elif command == 'display configuration candidate merge':
+                return self.show(self.candidate)
+            elif command == 'display current-configuration':
+                return self.show(self.running)
+            elif command == 'display configuration replace failed':
+                return ''
+            elif command == 'commit':
+                return self.commit()
+            elif command == 'run save':
+                self.confirm = lambda: 'Info: Save the configuration successfully.\n'
+                return None
+            elif command == 'screen-length 0 temporary':
+                return 'Info: The configuration takes effect on the current user terminal interface only.\n'
+            else:
+                return 'Error: Unrecognized command found at \'^\' position.\n'
+        else:
+            if command in ('config', 'configure'):
+                self.configure = True
+                return 'Entering configuration mode\n\n[edit]\n'
+            elif command == 'exit':
+                self.configure = False
+                return 'Exiting configuration mode\n'
+            elif command.startswith('load override'):
+                return self.load(words[-1]) or 'load complete\n'
+            elif command == 'commit':
+                return self.commit() or 'commit complete\n'
+            elif command == 'show configuration':
+                return self.show(self.running)
+            elif command == 'set cli screen-length 0':
+                return 'Screen length set to 0\n'
+            else:
+                return 'syntax error.\n'
+        return ''
+
+    def commit(self):
+        if self.candidate is not None:
+            self.running = self.candidate
+            self.candidate = None
+        return ''
+
+    def question(self, command):
+        if self.router_os == 'huawei':
+            return 'Warning: The current configuration will be written to the device. Continue? [Y/N]:'
+        return ('This commit will replace or remove the entire running configuration.\n'
+                'Do you wish to proceed? [no]: ')
+
+
+class DeviceServer(paramiko.ServerInterface):
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self.device = None
+
+    def get_allowed_auths(self, username):
+        return 'publickey,password'
+
+    def _auth(self, username):
+        self.device = self.fleet.get_device(username)
+        return paramiko.AUTH_SUCCESSFUL if self.device is not None else paramiko.AUTH_FAILED
+
+    def check_auth_publickey(self, username, key):
+        return self._auth(username)
+
+    def check_auth_password(self, username, password):
+        return self._auth(username)
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED_REQUEST
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_forward_agent_request(self, channel):
+        return False
+
+    def check_channel_shell_request(self, channel):
+        threading.Thread(target=self.fleet.shell, args=(self.device, channel), daemon=True).start()
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        args = shlex.split(command.decode())
+        if args[:2] != ['scp', '-t']:
+            return False
+        threading.Thread(target=self.fleet.scp_sink, args=(self.device, channel, args[-1]), daemon=True).start()
+        return True
+
+
+class FakeFleet:
+    '''
+    One listening socket for every device, start() returns the port
+    '''
+    def __init__(self, devices, latency=0.0, host='127.0.0.1', port=0):
+        self.devices = {device.hostname: device for device in devices}
+        self.latency = latency
+        self.host = host
+        self.port = port
+        self.host_key = paramiko.ECDSAKey.generate()
+        self._socket = None
+        self._transports = []
+
+    def get_device(self, hostname):
+        return self.devices.get(hostname)
+
+    def start(self):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self._socket.listen(512)
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self.port
+
+    def stop(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        for transport in self._transports:
+            transport.close()
+
+    def _accept(self):
+        while self._socket is not None:
+            try:
+                client, address = self._socket.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.set_log_channel('fakedevice.transport')
+            transport.add_server_key(self.host_key)
+            try:
+                transport.start_server(server=DeviceServer(self))
+            except (paramiko.SSHException, EOFError, OSError):
+                # e.g. a client that rejected the host key, keep accepting
+                transport.close()
+                continue
+            self._transports.append(transport)
+
+    def _send(self, channel, text):
+        channel.sendall(text.replace('\r\n', '\n').replace('\n', '\r\n').encode())
+
+    def shell(self, device, channel):
+        try:
+            time.sleep(self.latency)
+            self._send(channel, '\n' + device.prompt())
+            buffer = b''
+            while True:
+                data = channel.recv(65536)
+                if not data:
+                    return
+                buffer += data
+                while b'\n' in buffer:
+                    line, buffer = buffer.split(b'\n', 1)
+                    command = line.decode().rstrip('\r')
+                    time.sleep(self.latency)
+                    output = device.handle(command)
+                    if output is None:
+                        self._send(channel, command + '\n' + device.question(command))
+                    else:
+                        self._send(channel, command + '\n' + output + device.prompt())
+        except (EOFError, OSError):
+            return
+        finally:
+            channel.close()
+
+    def _read_line(self, channel):
+        line = b''
+        while not line.endswith(b'\n'):
+            data = channel.recv(1)
+            if not data:
+                return None
+            line += data
+        return line.decode().rstrip('\n')
+
+    def _read_exactly(self, channel, size):
+        data = b''
+        while len(data) < size:
+            chunk = channel.recv(min(65536, size - len(data)))
+            if not chunk:
+                raise EOFError('scp closed in the middle of a file')
+            data += chunk
+        return data
+
+    def scp_sink(self, device, channel, target):
+        '''
+        Receiving side of "scp -t target", single files only
+        '''
+        try:
+            channel.sendall(b'\0')
+            while True:
+                line = self._read_line(channel)
+                if line is None:
+                    break
+                if line.startswith('C'):
+                    mode, size, name = line[1:].split(' ', 2)
+                    channel.sendall(b'\0')
+                    content = self._read_exactly(channel, int(size) + 1)[:-1]
+                    with device.lock:
+                        device.files[os.path.basename(target.split(':', 1)[-1]) or name] = content.decode()
+                time.sleep(self.latency)
+                channel.sendall(b'\0')
+            # asyncssh closes the channel without waiting for the status, a
+            # message after its close would make it drop the connection
+            if not channel.closed:
+                channel.send_exit_status(0)
+        except (EOFError, OSError):
+            pass
+        finally:
+            channel.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('devices', nargs='+', help='hostname:os with os one of iosxr, huawei, junos')
+    parser.add_argument('--port', type=int, default=2222)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before every answer')
+    args = parser.parse_args()
+    devices = [FakeDevice(*device.split(':', 1)) for device in args.devices]
+    fleet = FakeFleet(devices, latency=args.latency, port=args.port)
+    print('listening on port {0}, log in with the router name as user'.format(fleet.start()))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fleet.stop()
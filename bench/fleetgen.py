@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+'''
+Synthetic fleet for benchmarks: hosts.yaml, global/, router_specific/,
+services/ and templates for iosxr, huawei and junos, sized by the number of
+routers, services, interfaces per router and prefix-set size.
+
+    python bench/fleetgen.py /tmp/fleet --routers 500 --services 100
+'''
+import os
+import random
+import argparse
+import yaml
+
+OS_LIST = ['iosxr', 'huawei', 'junos']
+
+INTERFACE_NAMES = {'iosxr': ('GigabitEthernet', 'GigabitEthernet0/0/0/{0}'),
+                   'huawei': ('GigabitEthernet', 'GigabitEthernet0/1/{0}'),
+                   'junos': ('ge', 'ge-0/0/{0}')}
+
+SERVICE_INTERFACE_NAMES = {'iosxr': ('Bundle-Ether', 'Bundle-Ether1.{0}'),
+                           'huawei': ('Eth-Trunk', 'Eth-Trunk1.{0}'),
+                           'junos': ('ae', 'ae1.{0}')}
+
+TEMPLATES = {
+    'iosxr': {
+        'main.j2': '''hostname {{ system.hostname }}
+domain name {{ system.domain }}
+{% for server in system.ntp %}
+ntp server {{ server }}
+{% endfor %}
+!
+{% include 'global/templates/iosxr/interfaces.j2' %}
+{% include 'global/templates/iosxr/policy.j2' %}
+{% include 'global/templates/iosxr/l3vpn.j2' %}
+end
+''',
+        'interfaces.j2': '''{% for type, names in interfaces.items() %}
+{% for name, interface in names.items() %}
+interface {{ name }}
+ description {{ interface.descr }}
+{% if interface.vrf is defined %}
+ vrf {{ interface.vrf }}
+{% endif %}
+ ipv4 address {{ interface.ipv4 }}
+ mtu {{ interface.mtu }}
+!
+{% endfor %}
+{% endfor %}
+''',
+        'policy.j2': '''{% for name, prefixes in routing_policy.sets.prefix_sets.items() %}
+prefix-set {{ name }}
+{% for prefix in prefixes %}
+  {{ prefix }}{{ "," if not loop.last }}
+{% endfor %}
+end-set
+!
+{% endfor %}
+{% for name, community in routing_policy.sets.community_sets.items() %}
+community-set {{ name }}
+  {{ community }}
+end-set
+!
+{% endfor %}
+''',
+        'l3vpn.j2': '''{% for name, vrf in (l3vpn or {}).items() %}
+vrf {{ name }}
+ rd {{ vrf.rd | join(',') }}
+ address-family ipv4 unicast
+{% for rt in vrf.rt %}
+  import route-target {{ rt }}
+  export route-target {{ rt }}
+{% endfor %}
+!
+{% endfor %}
+''',
+    },
+    'huawei': {
+        'main.j2': '''sysname {{ system.hostname }}
+#
+{% for server in system.ntp %}
+ntp unicast-server {{ server }}
+{% endfor %}
+#
+{% include 'global/templates/huawei/l3vpn.j2' %}
+{% include 'global/templates/huawei/interfaces.j2' %}
+{% include 'global/templates/huawei/policy.j2' %}
+return
+''',
+        'interfaces.j2': '''{% for type, names in interfaces.items() %}
+{% for name, interface in names.items() %}
+interface {{ name }}
+ description {{ interface.descr }}
+{% if interface.vrf is defined %}
+ ip binding vpn-instance {{ interface.vrf }}
+{% endif %}
+ ip address {{ interface.ipv4 | replace('/', ' ') }}
+ mtu {{ interface.mtu }}
+#
+{% endfor %}
+{% endfor %}
+''',
+        'policy.j2': '''{% for name, prefixes in routing_policy.sets.prefix_sets.items() %}
+{% for prefix in prefixes %}
+ip ip-prefix {{ name }} index {{ loop.index * 10 }} permit {{ prefix | replace('/', ' ') }}
+{% endfor %}
+#
+{% endfor %}
+{% for name, community in routing_policy.sets.community_sets.items() %}
+ip community-filter basic {{ name }} permit {{ community }}
+#
+{% endfor %}
+''',
+        'l3vpn.j2': '''{% for name, vrf in (l3vpn or {}).items() %}
+ip vpn-instance {{ name }}
+ ipv4-family
+  route-distinguisher {{ vrf.rd | first }}
+{% for rt in vrf.rt %}
+  vpn-target {{ rt }} both
+{% endfor %}
+#
+{% endfor %}
+''',
+    },
+    'junos': {
+        'main.j2': '''system {
+    host-name {{ system.hostname }};
+    domain-name {{ system.domain }};
+    ntp {
+{% for server in system.ntp %}
+        server {{ server }};
+{% endfor %}
+    }
+}
+{% include 'global/templates/junos/interfaces.j2' %}
+
+{% include 'global/templates/junos/policy.j2' %}
+
+{% include 'global/templates/junos/l3vpn.j2' %}
+
+''',
+        'interfaces.j2': '''interfaces {
+{% for type, names in interfaces.items() %}
+{% for name, interface in names.items() %}
+    {{ name }} {
+        description "{{ interface.descr }}";
+        mtu {{ interface.mtu }};
+        family inet {
+            address {{ interface.ipv4 }};
+        }
+    }
+{% endfor %}
+{% endfor %}
+}
+''',
+        'policy.j2': '''policy-options {
+{% for name, prefixes in routing_policy.sets.prefix_sets.items() %}
+    prefix-list {{ name }} {
+{% for prefix in prefixes %}
+        {{ prefix }};
+{% endfor %}
+    }
+{% endfor %}
+{% for name, community in routing_policy.sets.community_sets.items() %}
+    community {{ name }} members {{ community }};
+{% endfor %}
+}
+''',
+        'l3vpn.j2': '''routing-instances {
+{% for name, vrf in (l3vpn or {}).items() %}
+    {{ name }} {
+        instance-type vrf;
+        route-distinguisher {{ vrf.rd | first }};
+{% for rt in vrf.rt %}
+        vrf-target target:{{ rt }};
+{% endfor %}
+    }
+{% endfor %}
+}
+''',
+    },
+}
+
+
+def get_hostname(index, router_os):
+    return 'r{0:05d}-{1}'.format(index, router_os)
+
+
+def get_prefix(rng):
+    return '10.{0}.{1}.0/24'.format(rng.randrange(256), rng.randrange(256))
+
+
+def write_yaml(fname, data):
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    with open(fname, 'w') as outfile:
+        yaml.safe_dump(data, outfile, default_flow_style=False, sort_keys=False)
+
+
+def generate(directory, routers=100, services=20, interfaces=24, prefix_sets=10, prefixes=50,
+             routers_per_service=10, os_list=None, seed=0):
+    '''
+    Write the fleet into directory, returns the list of routers of hosts.yaml
+    '''
+    rng = random.Random(seed)
+    os_list = os_list or OS_LIST
+    hosts = [{'router_os': os_list[index % len(os_list)],
+              'router_hostname': get_hostname(index, os_list[index % len(os_list)])} for index in range(routers)]
+    write_yaml(os.path.join(directory, 'hosts.yaml'), {'routers': hosts})
+    os.makedirs(os.path.join(directory, 'conf'), exist_ok=True)
+
+    write_yaml(os.path.join(directory, 'global', '10-system.yaml'), {
+        'system': {'domain': 'example.net', 'ntp': ['192.0.2.1', '192.0.2.2']},
+        'interfaces': {},
+    })
+    write_yaml(os.path.join(directory, 'global', '20-policy.yaml'), {
+        'routing_policy': {'sets': {
+            'prefix_sets': {'PS-{0:03d}'.format(index): sorted(set(get_prefix(rng) for _ in range(prefixes)))
+                            for index in rng.sample(range(prefix_sets * 10), prefix_sets)},
+            'community_sets': {'CS-{0:03d}'.format(index): '65000:{0}'.format(index)
+                               for index in rng.sample(range(prefix_sets * 10), prefix_sets)},
+        }},
+    })
+    for router_os, templates in TEMPLATES.items():
+        for name, template in templates.items():
+            fname = os.path.join(directory, 'global', 'templates', router_os, name)
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            with open(fname, 'w') as outfile:
+                outfile.write(template)
+
+    for index, host in enumerate(hosts):
+        interface_type, interface_name = INTERFACE_NAMES[host['router_os']]
+        names = list(range(interfaces))
+        rng.shuffle(names)
+        write_yaml(os.path.join(directory, 'router_specific', host['router_hostname'], '10-system.yaml'), {
+            'system': {'hostname': host['router_hostname']},
+        })
+        write_yaml(os.path.join(directory, 'router_specific', host['router_hostname'], '20-interfaces.yaml'), {
+            'interfaces': {interface_type: {
+                interface_name.format(name): {'descr': 'core link {0}'.format(name),
+                                              'ipv4': '172.{0}.{1}.{2}/31'.format(16 + index // 65536 % 16,
+                                                                                  index // 256 % 256, name * 2 % 256),
+                                              'mtu': 9100}
+                for name in names}},
+        })
+
+    for index in range(services):
+        vrf = 'VRF-{0:04d}'.format(index)
+        members = rng.sample(hosts, min(routers_per_service, len(hosts)))
+        service = {'l3vpn': {vrf: {'rd': ['65000:{0}'.format(index)], 'rt': ['65000:{0}'.format(index)]}}}
+        for member in members:
+            interface_type, interface_name = SERVICE_INTERFACE_NAMES[member['router_os']]
+            service[member['router_hostname']] = {'interfaces': {interface_type: {
+                interface_name.format(100 + index): {'descr': 'customer {0}'.format(vrf), 'vrf': vrf,
+                                                     'ipv4': '100.{0}.{1}.1/30'.format(index // 256 % 256, index % 256),
+                                                     'mtu': 1500}}}}
+        write_yaml(os.path.join(directory, 'services', 'l3vpn', 'svc-{0:04d}.yaml'.format(index)), service)
+    return hosts
+
+
+def add_fleet_arguments(parser):
+    parser.add_argument('--routers', type=int, default=100, help='number of routers')
+    parser.add_argument('--services', type=int, default=20, help='number of l3vpn service files')
+    parser.add_argument('--routers-per-service', type=int, default=10, help='routers attached to each service')
+    parser.add_argument('--interfaces', type=int, default=24, help='interfaces per router')
+    parser.add_argument('--prefix-sets', type=int, default=10, help='number of prefix sets')
+    parser.add_argument('--prefixes', type=int, default=50, help='prefixes per prefix set')
+    parser.add_argument('--os', dest='os_list', nargs='+', choices=OS_LIST, default=OS_LIST,
+                        help='router OSes, assigned round robin')
+    parser.add_argument('--seed', type=int, default=0, help='random seed, the same seed gives the same fleet')
+
+
+def get_fleet_parameters(args):
+    return {'routers': args.routers, 'services': args.services, 'routers_per_service': args.routers_per_service,
+            'interfaces': args.interfaces, 'prefix_sets': args.prefix_sets, 'prefixes': args.prefixes,
+            'os_list': args.os_list, 'seed': args.seed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory', help='where the fleet is written')
+    add_fleet_arguments(parser)
+    args = parser.parse_args()
+    hosts = generate(args.directory, **get_fleet_parameters(args))
+    print('{0} routers written to {1}'.format(len(hosts), args.directory))
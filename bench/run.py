@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+'''
+Benchmarks of the render and transport paths on a synthetic fleet (see
+fleetgen.py) with fake devices (see fakedevice.py). Every run is appended to
+a JSONL history and compared with the median of the previous runs with the
+same parameters; a benchmark slower by more than --threshold exits 1, so CI
+can keep the history file between runs and fail on regressions.
+
+    python bench/run.py --routers 300 --services 60 --latency 0.01
+'''
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import fleetgen
+
+
+def best_of(repeat, function):
+    '''
+    Fastest of repeat runs, the slower ones measure the machine, not the code
+    '''
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def write_ssh_config(directory, routers, port):
+    import paramiko
+    key_file = os.path.join(directory, 'id_ecdsa')
+    paramiko.ECDSAKey.generate().write_private_key_file(key_file)
+    ssh_config = os.path.join(directory, 'ssh_config')
+    with open(ssh_config, 'w') as outfile:
+        for router_data in routers:
+            outfile.write('Host {0}\n    User {0}\n'.format(router_data['router_hostname']))
+        outfile.write('Host *\n    HostName 127.0.0.1\n    Port {0}\n    IdentityFile {1}\n'.format(port, key_file))
+    return ssh_config
+
+
+def run_fleet(routers, function, workers):
+    import fleet
+    import generic
+    generic.close_connections()
+    results = fleet.FleetRunner(function, max_workers=workers, stream=io.StringIO(),
+                                cleanup=generic.close_router_connection).run(routers)
+    failed = [result for result in results if result.status != 'ok']
+    if failed:
+        raise RuntimeError('{0} routers failed, first {1}: {2!r}'.format(len(failed), failed[0].hostname,
+                                                                        failed[0].error))
+
+
+def run_benchmarks(args, directory):
+    '''
+    {benchmark: seconds} for the fleet in directory, the process works in
+    directory from here on as settings resolve paths against it on import
+    '''
+    os.chdir(directory)
+    import yaml
+    import settings
+    import generic
+    generic.configure_data_cache(argparse.Namespace(no_cache=True, clear_cache=False))
+    with open(settings.HOSTS_FILE) as stream:
+        routers = yaml.safe_load(stream)['routers']
+    results = {}
+
+    def load_cold():
+        generic.clear_data_cache()
+        for router_data in routers:
+            generic.get_router_varibles(dict(router_data))
+    results['get_router_varibles_cold'] = best_of(args.repeat, load_cold)
+
+    def load_warm():
+        for router_data in routers:
+            generic.get_router_varibles(dict(router_data))
+    results['get_router_varibles'] = best_of(args.repeat, load_warm)
+
+    layers = {}
+    for router_data in routers:
+        hostname = router_data['router_hostname']
+        layers[hostname] = [generic.get_data_from_directories(router_data, 'global/'),
+                            generic.get_data_from_directories(router_data, 'router_specific/', hostname)]
+        layers[hostname] += generic.get_data_for_services(router_data, generic.get_service_files(hostname))
+    results['dict_of_dicts_merge'] = best_of(args.repeat, lambda: [
+        generic.dict_reduce(generic.dict_of_dicts_merge, layers[router_data['router_hostname']], router_data)
+        for router_data in routers])
+
+    merged = {router_data['router_hostname']: generic.dict_reduce(
+        generic.dict_of_dicts_merge, layers[router_data['router_hostname']], router_data) for router_data in routers}
+    results['check_config_data'] = best_of(args.repeat, lambda: [
+        generic.check_config_data(merged[router_data['router_hostname']]).normalize() for router_data in routers])
+
+    variables = {router_data['router_hostname']: generic.get_router_varibles(dict(router_data))
+                 for router_data in routers}
+    results['render_jinja_template'] = best_of(args.repeat, lambda: [
+        generic.render_jinja_template(router_data, variables[router_data['router_hostname']])
+        for router_data in routers])
+
+    if args.no_transport:
+        return results
+
+    import fakedevice
+    devices = []
+    for router_data in routers:
+        router_data['system_hostname'] = router_data['router_hostname']
+        config_file, config = generic.render_router_config(router_data, variables[router_data['router_hostname']])
+        devices.append(fakedevice.FakeDevice(router_data['router_hostname'], router_data['router_os'],
+                                             config.replace('mtu 1500', 'mtu 1514', 1)))
+    device_fleet = fakedevice.FakeFleet(devices, latency=args.latency)
+    settings.SSH_CONFIG = write_ssh_config(directory, routers, device_fleet.start())
+    try:
+        results['get_config_from_router'] = best_of(args.repeat, lambda: run_fleet(
+            routers, lambda data: generic.get_config_from_router(
+                data, generic.get_file_path(data['router_hostname'], 'current.cfg')), args.workers))
+        diff_routers = [router_data for router_data in routers if router_data['router_os'] in ('iosxr', 'huawei')]
+        if diff_routers:
+            results['get_diff_from_router'] = best_of(args.repeat, lambda: run_fleet(
+                diff_routers, lambda data: generic.get_diff_from_router(
+                    data, generic.get_file_path(data['router_hostname'], 'rendered.cfg')), args.workers))
+        results['push_config_to_router'] = best_of(args.repeat, lambda: run_fleet(
+            routers, lambda data: generic.push_config_to_router(
+                data, generic.get_file_path(data['router_hostname'], 'rendered.cfg')), args.workers))
+    finally:
+        generic.close_connections()
+        device_fleet.stop()
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(history_file):
+    try:
+        with open(history_file) as stream:
+            return [json.loads(line) for line in stream if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def compare(entry, history, window, threshold):
+    '''
+    [(benchmark, seconds, baseline or None, regression)] against the median of
+    the last window runs with the same parameters
+    '''
+    previous = [old for old in history if old['parameters'] == entry['parameters']][-window:]
+    rows = []
+    for name, seconds in entry['results'].items():
+        values = [old['results'][name] for old in previous if name in old['results']]
+        baseline = statistics.median(values) if values else None
+        rows.append((name, seconds, baseline, baseline is not None and seconds > baseline * (1 + threshold)))
+    return rows
+
+
+def report(rows, routers, stream=None):
+    stream = stream if stream is not None else sys.stdout
+    stream.write('{0:<28}{1:>12}{2:>14}{3:>12}{4:>10}\n'.format('benchmark', 'seconds', 'ms/router', 'baseline',
+                                                              'change'))
+    for name, seconds, baseline, regression in rows:
+        change = '' if baseline is None else '{0:+.1%}'.format(seconds / baseline - 1)
+        stream.write('{0:<28}{1:>12.4f}{2:>14.3f}{3:>12}{4:>10}{5}\n'.format(
+            name, seconds, seconds * 1000 / max(routers, 1), '' if baseline is None else '{0:.4f}'.format(baseline),
+            change, '  REGRESSION' if regression else ''))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    fleetgen.add_fleet_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every benchmark, the fastest counts')
+    parser.add_argument('--workers', type=int, default=20, help='routers handled at the same time on fake devices')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds a fake device waits before every answer')
+    parser.add_argument('--no-transport', action='store_true', help='skip the fake device benchmarks')
+    parser.add_argument('--directory', help='generate the fleet here and keep it, a temporary directory by default')
+    parser.add_argument('--history', default=os.path.join(BENCH_DIR, 'history.jsonl'),
+                        help='JSONL file every run is appended to (default: %(default)s)')
+    parser.add_argument('--no-history', action='store_true', help='do not append this run to the history')
+    parser.add_argument('--window', type=int, default=5, help='previous runs the baseline is the median of')
+    parser.add_argument('--threshold', type=float, default=0.25, help='slowdown reported as a regression')
+    args = parser.parse_args()
+
+    history_file = os.path.abspath(args.history)
+    parameters = fleetgen.get_fleet_parameters(args)
+    directory = os.path.abspath(args.directory) if args.directory else tempfile.mkdtemp(prefix='pynconf-bench-')
+    try:
+        fleetgen.generate(directory, **parameters)
+        parameters.update(latency=args.latency, workers=args.workers, transport=not args.no_transport)
+        results = run_benchmarks(args, directory)
+    finally:
+        os.chdir(REPO_DIR)
+        if not args.directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    entry = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': get_commit(), 'python': platform.python_version(),
+             'parameters': parameters, 'results': {name: round(seconds, 6) for name, seconds in results.items()}}
+    rows = compare(entry, load_history(history_file), args.window, args.threshold)
+    report(rows, args.routers)
+    if not args.no_history:
+        with open(history_file, 'a') as outfile:
+            outfile.write(json.dumps(entry, sort_keys=True) + '\n')
+    if any(regression for name, seconds, baseline, regression in rows):
+        sys.exit(1)
@@ -0,0 +1,98 @@
+'''
+What changed in git against the base ref, computed once per run.
+'''
+import re
+import settings
+import os
+import hashlib
+import itertools
+import threading
+from git import Repo
+import metrics
+import logging
+logger = logging.getLogger()
+
+def get_changet_files(base_ref=None):
+    '''
+    repo is a Repo instance pointing to the git-python repository,
+    get yaml changet files names
+    '''
+    repo = Repo()
+    files_list = []
+    with metrics.timed('git_diff'):
+        diff_files = repo.git.diff(base_ref or settings.GIT_DIFF_BASE, name_only=True).splitlines()
+    for diff_file in diff_files:
+        if diff_file.endswith('.cfg'):
+            files_list.append(diff_file)
+
+    return files_list
+#
+def get_changet_hostnames(changet_files):
+    return set(itertools.chain.from_iterable(filter(None, re.split(".rendered.cfg|/", x)) for x in changet_files))
+#
+def get_git_blob_hash(content):
+    content = content.encode()
+    return hashlib.sha1(b'blob %d\0' % len(content) + content).hexdigest()
+#
+class ChangeSet:
+    '''
+    Files changed against base_ref, git runs once per run instead of once per
+    router. Freshly rendered configs are compared with their blob at base_ref,
+    which is what git diff base_ref would say about them after the write.
+    '''
+    def __init__(self, base_ref=None, merge_base=False):
+        repo = Repo()
+        base_ref = base_ref or settings.GIT_DIFF_BASE
+        if merge_base:
+            base_ref = repo.merge_base(base_ref, 'HEAD')[0].hexsha
+        self.base_ref = base_ref
+        self.working_tree_dir = repo.working_tree_dir
+        with metrics.timed('git_diff'):
+            self.files = repo.git.diff(base_ref, name_only=True).splitlines()
+        self.config_files = [diff_file for diff_file in self.files if diff_file.endswith('.cfg')]
+        self.hostnames = get_changet_hostnames(self.config_files)
+        self.base_blobs = {}
+        config_directory = os.path.relpath(str(settings.CONFIG_FILES_DIRECTORY), self.working_tree_dir)
+        for line in repo.git.ls_tree('-r', base_ref, '--', config_directory).splitlines():
+            blob, path = line.split('\t', 1)
+            self.base_blobs[path] = blob.split()[2]
+        self._lock = threading.Lock()
+
+    def update_rendered(self, data, config_file, config):
+        path = os.path.relpath(str(config_file), self.working_tree_dir)
+        with self._lock:
+            if self.base_blobs.get(path) != get_git_blob_hash(config):
+                self.hostnames.add(data['router_hostname'])
+            elif path in self.config_files:
+                self.hostnames.discard(data['router_hostname'])
+
+    def __contains__(self, hostname):
+        return hostname in self.hostnames
+
+_change_set = {}
+_change_set_lock = threading.Lock()
+
+def get_change_set(base_ref=None, merge_base=False):
+    with _change_set_lock:
+        if 'change_set' not in _change_set:
+            _change_set['change_set'] = ChangeSet(base_ref, merge_base)
+    return _change_set['change_set']
+#
+def add_change_set_arguments(parser):
+    parser.add_argument('--base-ref', default=settings.GIT_DIFF_BASE,
+                        help='git ref the changes are computed against (default: %(default)s)')
+    parser.add_argument('--merge-base', action='store_true',
+                        help='compare against the merge base of --base-ref and HEAD, e.g. the target branch of a MR')
+#
+def configure_change_set(args):
+    return get_change_set(args.base_ref, args.merge_base)
+#
+def add_impact_arguments(parser):
+    parser.add_argument('--only-affected', action='store_true',
+                        help='skip routers whose recorded YAML, service and template inputs did not change')
+#
+def if_router_in_changet_files(data, changet_files):
+
+    if isinstance(changet_files, ChangeSet):
+        return data['router_hostname'] in changet_files
+    return data['router_hostname'] in get_changet_hostnames(changet_files)
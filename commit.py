@@ -1,62 +1,91 @@
 #!/usr/bin/env python3
 import settings
 import generic
+import fleet
+import metrics
+import rollout
 import yaml
 import sys, os
+import argparse
 import warnings
 warnings.filterwarnings(action='ignore',module='.*paramiko.*')
 from colorama import init, deinit, Fore, Style
 
 init(autoreset=True)
 
-def deploy(data):
+def render(data):
 
-    # configuration from YAMLs
+    # configuration from YAMLs and render template
 
-    router_vars = generic.get_router_varibles(data)
-    data['system_hostname'] = router_vars['system']['hostname']
+    config_file, config = generic.build_router_config(data)
 
-    ## render template
+    # check what has been updated
+    change_set = generic.get_change_set()
+    change_set.update_rendered(data, config_file, config)
+    if generic.if_router_in_changet_files(data, change_set):
+        return config_file
+    return None
 
-    config = generic.render_jinja_template(data, router_vars)
-    config_file = generic.get_file_path(data['router_hostname'], 'rendered.cfg')
-    with open(config_file, "w") as outfile:
-        outfile.write(config)
+def deploy(data, config_file):
 
-    # check what has been updated
-    changet_files = generic.get_changet_files()
-    if generic.if_router_in_changet_files(data, changet_files):
-
-        # push configuration
-        output = generic.push_config_to_router(data, config_file)
-        sys.stdout.write(Fore.CYAN + Style.BRIGHT + "\n#######"+len(data['router_hostname'])*"#"+"################\n")
-        sys.stdout.write(Fore.CYAN + Style.BRIGHT + "| Push {0} configuration |".format(data['router_hostname']))
-        sys.stdout.write(Fore.CYAN + Style.BRIGHT + "\n#######"+len(data['router_hostname'])*"#"+"################\n")
-        sys.stdout.flush()
-        try:
-            sys.stdout.write(output + '\n')
-            sys.stdout.flush()
-        except TypeError:
-            sys.stdout.write('None \n')
-            sys.stdout.flush()
-        sys.stdout.write(Fore.CYAN + Style.BRIGHT + "\n##########"+len(data['router_hostname'])*"#"+"###\n")
-        sys.stdout.write(Fore.CYAN + Style.BRIGHT + "| Done for {0} |".format(data['router_hostname']))
-        sys.stdout.write(Fore.CYAN + Style.BRIGHT + "\n##########"+len(data['router_hostname'])*"#"+"###\n")
+    # push configuration
+    output = generic.push_config_to_router(data, config_file)
+    report = []
+    report.append(Fore.CYAN + Style.BRIGHT + "\n#######"+len(data['router_hostname'])*"#"+"################\n")
+    report.append(Fore.CYAN + Style.BRIGHT + "| Push {0} configuration |".format(data['router_hostname']))
+    report.append(Fore.CYAN + Style.BRIGHT + "\n#######"+len(data['router_hostname'])*"#"+"################\n")
+    try:
+        report.append(output + '\n')
+    except TypeError:
+        report.append('None \n')
+    report.append(Fore.CYAN + Style.BRIGHT + "\n##########"+len(data['router_hostname'])*"#"+"###\n")
+    report.append(Fore.CYAN + Style.BRIGHT + "| Done for {0} |".format(data['router_hostname']))
+    report.append(Fore.CYAN + Style.BRIGHT + "\n##########"+len(data['router_hostname'])*"#"+"###\n")
+    return ''.join(report)
 
 
-def prepare_data():
+def prepare_data(args):
     with open(settings.HOSTS_FILE, 'r') as stream:
         try:
             data = yaml.safe_load(stream)
         except yaml.YAMLError as exc:
             print(exc)
-    for router_data in data['routers']:
-        deploy(router_data)
+    routers = data['routers']
+    if args.only_affected:
+        routers = generic.select_affected_routers(routers, generic.get_change_set())
+    runner = rollout.Rollout(render, deploy, canary=args.canary, growth=args.growth, max_wave=args.max_wave,
+                             max_failures=args.max_failures, max_failure_ratio=args.max_failure_ratio,
+                             pause=args.pause, max_workers=args.workers, timeout=args.timeout,
+                             cleanup=generic.close_router_connection)
+    return runner.run(routers)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    generic.add_data_cache_arguments(parser)
+    fleet.add_fleet_arguments(parser)
+    rollout.add_rollout_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    generic.add_change_set_arguments(parser)
+    generic.add_impact_arguments(parser)
+    generic.add_incremental_arguments(parser)
+    args = parser.parse_args()
+    generic.setup_logging()
+    generic.configure_data_cache(args)
+    metrics.configure_metrics(args)
+    generic.configure_change_set(args)
+    generic.configure_incremental(args)
     sys.stdout.write(Fore.CYAN + Style.BRIGHT + " START \n")
     sys.stdout.flush()
-    prepare_data()
+    try:
+        results = prepare_data(args)
+    finally:
+        generic.close_connections()
+    generic.save_dependencies()
+    generic.save_render_manifest()
+    generic.log_data_cache_stats()
+    metrics.save_run_report(results)
+    sys.stdout.write(Fore.CYAN + Style.BRIGHT + fleet.summary(results))
     sys.stdout.write(Fore.CYAN + Style.BRIGHT + " STOP \n")
     sys.stdout.flush()
-
+    if any(result.status != 'ok' for result in results):
+        sys.exit(1)
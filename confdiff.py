@@ -0,0 +1,220 @@
+'''
+Structural diff of device configurations. Top level blocks (IOS-XR '!',
+Huawei '#' separated sections, Junos brace blocks) are keyed by their header
+line and compared with the block of the same header, so moved blocks do not
+show up. Lines inside a changed block are compared with patience diff on
+hashed lines.
+'''
+import re
+from bisect import bisect_left
+import settings
+
+COMMENT_CHARS = {'iosxr': '!', 'huawei': '#', 'huaweiyang': '#', 'junos': '#'}
+# IOS-XR closes prefix-set, route-policy, neighbor-group ... at column 0
+BLOCK_END = re.compile(r'^end-[\w-]+$')
+
+
+def parse_blocks(text, router_os):
+    '''
+    [(header, [lines])] in config order, comment/separator lines dropped,
+    indented lines, closing braces and end-set / end-policy ... lines belong
+    to the block above them
+    '''
+    comment = COMMENT_CHARS.get(router_os, '!')
+    blocks = []
+    lines = None
+    for line in text.splitlines():
+        line = line.rstrip()
+        stripped = line.strip()
+        if not stripped or stripped.startswith(comment):
+            continue
+        if line[0].isspace() or stripped[0] == '}' or (lines is not None and BLOCK_END.match(line)):
+            if lines is None:
+                lines = []
+                blocks.append(('', lines))
+            lines.append(line)
+            continue
+        lines = [line]
+        blocks.append((line, lines))
+    return blocks
+
+
+def key_blocks(blocks):
+    '''
+    Key every block by (header, occurrence) so repeated headers stay apart
+    '''
+    seen = {}
+    keyed = []
+    for header, lines in blocks:
+        seen[header] = seen.get(header, 0) + 1
+        keyed.append(((header, seen[header]), lines))
+    return keyed
+
+
+def _unique(lines, lo, hi):
+    positions = {}
+    for index in range(lo, hi):
+        line = lines[index]
+        positions[line] = -1 if line in positions else index
+    return positions
+
+
+def _longest_increasing(pairs):
+    '''
+    Patience sorting: longest run of pairs increasing in both a and b
+    '''
+    tails = []
+    tails_pairs = []
+    previous = {}
+    for pair in pairs:
+        position = bisect_left(tails, pair[1])
+        previous[pair] = tails_pairs[position - 1] if position else None
+        if position == len(tails):
+            tails.append(pair[1])
+            tails_pairs.append(pair)
+        else:
+            tails[position] = pair[1]
+            tails_pairs[position] = pair
+    result = []
+    pair = tails_pairs[-1] if tails_pairs else None
+    while pair is not None:
+        result.append(pair)
+        pair = previous[pair]
+    result.reverse()
+    return result
+
+
+def patience_matches(a, b, alo=0, ahi=None, blo=0, bhi=None, matches=None):
+    '''
+    Matching (i, j) index pairs of a and b, lines unique on both sides are
+    the anchors, the gaps between anchors are diffed the same way
+    '''
+    if ahi is None:
+        ahi = len(a)
+    if bhi is None:
+        bhi = len(b)
+    if matches is None:
+        matches = []
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        matches.append((alo, blo))
+        alo += 1
+        blo += 1
+    suffix = []
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+        suffix.append((ahi, bhi))
+    if alo < ahi and blo < bhi:
+        unique_a = _unique(a, alo, ahi)
+        unique_b = _unique(b, blo, bhi)
+        pairs = [(index, unique_b[line]) for line, index in unique_a.items()
+                 if index >= 0 and unique_b.get(line, -1) >= 0]
+        pairs.sort()
+        anchors = _longest_increasing(pairs)
+        if anchors:
+            last_a, last_b = alo, blo
+            for anchor_a, anchor_b in anchors:
+                patience_matches(a, b, last_a, anchor_a, last_b, anchor_b, matches)
+                matches.append((anchor_a, anchor_b))
+                last_a, last_b = anchor_a + 1, anchor_b + 1
+            patience_matches(a, b, last_a, ahi, last_b, bhi, matches)
+    matches.extend(reversed(suffix))
+    return matches
+
+
+def get_opcodes(a, b):
+    '''
+    difflib style ('equal' | 'replace' | 'delete' | 'insert', i1, i2, j1, j2)
+    '''
+    opcodes = []
+    i = j = 0
+    for match_a, match_b in patience_matches(a, b) + [(len(a), len(b))]:
+        if i < match_a or j < match_b:
+            tag = 'replace' if i < match_a and j < match_b else 'delete' if i < match_a else 'insert'
+            opcodes.append((tag, i, match_a, j, match_b))
+        if match_a < len(a):
+            if opcodes and opcodes[-1][0] == 'equal':
+                opcodes[-1] = ('equal', opcodes[-1][1], match_a + 1, opcodes[-1][3], match_b + 1)
+            else:
+                opcodes.append(('equal', match_a, match_a + 1, match_b, match_b + 1))
+        i, j = match_a + 1, match_b + 1
+    return opcodes
+
+
+def diff_lines(before, after, context):
+    '''
+    Unified diff lines of two line lists, compared as interned integers,
+    unchanged runs longer than the context are shown as ...
+    '''
+    ids = {}
+    a = [ids.setdefault(line, len(ids)) for line in before]
+    b = [ids.setdefault(line, len(ids)) for line in after]
+    entries = []
+    for tag, i1, i2, j1, j2 in get_opcodes(a, b):
+        if tag == 'equal':
+            entries.extend(' ' + line for line in before[i1:i2])
+        else:
+            entries.extend('-' + line for line in before[i1:i2])
+            entries.extend('+' + line for line in after[j1:j2])
+    shown = set()
+    for index, entry in enumerate(entries):
+        if entry[0] != ' ':
+            shown.update(range(max(0, index - context), min(len(entries), index + context + 1)))
+    output = []
+    for index, entry in enumerate(entries):
+        if index in shown:
+            output.append(entry)
+        elif not output or output[-1] != '...':
+            output.append('...')
+    return output
+
+
+def diff_configs(before, after, router_os, context=None, fromfile='delete', tofile='add'):
+    '''
+    Block by block diff of two configuration texts, '' when they are the same
+    '''
+    context = settings.DIFF_CONTEXT if context is None else context
+    before_blocks = key_blocks(parse_blocks(before, router_os))
+    after_blocks = key_blocks(parse_blocks(after, router_os))
+    before_keys = dict(before_blocks)
+    after_keys = dict(after_blocks)
+
+    removed_before = {}
+    removed = []
+    for key, lines in before_blocks:
+        if key in after_keys:
+            if removed:
+                removed_before[key] = removed
+                removed = []
+        else:
+            removed.append((key, lines))
+
+    output = []
+    flat = {'end': None}
+
+    def add_block(key, lines, sign):
+        # a block that is only its header line would repeat it as the hunk
+        # header, consecutive ones share a single @@ @@ instead
+        if len(lines) == 1:
+            if flat['end'] != len(output):
+                output.append('@@ @@')
+            output.append(sign + lines[0])
+            flat['end'] = len(output)
+            return
+        output.append('@@ {0} @@'.format(key[0]))
+        output.extend(sign + line for line in lines)
+
+    for key, lines in after_blocks:
+        for removed_key, removed_lines in removed_before.get(key, ()):
+            add_block(removed_key, removed_lines, '-')
+        if key not in before_keys:
+            add_block(key, lines, '+')
+        elif before_keys[key] != lines:
+            output.append('@@ {0} @@'.format(key[0]))
+            output.extend(diff_lines(before_keys[key], lines, context))
+    for removed_key, removed_lines in removed:
+        add_block(removed_key, removed_lines, '-')
+
+    if not output:
+        return ''
+    return '\n'.join(['--- ' + fromfile, '+++ ' + tofile] + output) + '\n'
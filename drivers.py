@@ -0,0 +1,155 @@
+'''
+Per OS device drivers: prompt, command lists, remote file and the patterns
+that find the configuration and the errors in the device output. A driver is
+built once per router with every regex compiled, transport only asks
+get_driver(data) for it.
+
+Other platforms are plugins: a module listed in settings.DEVICE_DRIVER_MODULES
+subclasses DeviceDriver and calls register_driver(MyDriver) on import.
+'''
+import re
+import threading
+import importlib
+import settings
+import logging
+logger = logging.getLogger()
+
+
+class UnknownRouterOS(Exception):
+    '''
+    No driver is registered for the router_os of a router
+    '''
+    def __init__(self, hostname, router_os):
+        self.hostname = hostname
+        self.router_os = router_os
+        super(UnknownRouterOS, self).__init__("{0}: no device driver for router_os {1!r}, known: {2}".format(
+            hostname, router_os, ', '.join(sorted(_drivers)) or 'none'))
+
+
+def compile_errors(patterns):
+    '''
+    One regex for every error pattern, pattern n is the named group e<n>
+    '''
+    return re.compile('|'.join('(?P<e{0}>{1})'.format(index, pattern) for index, pattern in enumerate(patterns)))
+
+
+class DeviceDriver:
+    '''
+    Subclasses only set the class attributes. prompt is formatted with the
+    escaped system hostname, errors are added to settings.EXPECT_LIST_ERRORS
+    and settings.EXPECT_LIST_ERRORS_OS of the OS.
+    '''
+    os_names = ()
+    prompt = None
+    get_run = []
+    get_diff = []
+    push_config = []
+    remote_file = None
+    running_search = None
+    capture_start = None
+    capture_end = None
+    errors = []
+
+    def __init__(self, router_os, hostname):
+        self.router_os = router_os
+        self.hostname = hostname
+        self.prompt_regex = re.compile(self.prompt.format(hostname=re.escape(hostname)))
+        self.running_search_regex = re.compile(self.running_search, re.S)
+        self.capture_start_regex = re.compile(self.capture_start)
+        self.capture_end_regex = re.compile(self.capture_end)
+        self.error_patterns = self.get_error_patterns(router_os)
+        self.error_regex = compile_errors(self.error_patterns)
+
+    @classmethod
+    def get_error_patterns(cls, router_os):
+        return settings.EXPECT_LIST_ERRORS + settings.EXPECT_LIST_ERRORS_OS.get(router_os, []) + cls.errors
+
+
+class IOSXRDriver(DeviceDriver):
+    os_names = ('iosxr',)
+    prompt = r'^.*:({hostname}|\S*)#$'
+    get_run = settings.CISCO_GET_RUN
+    get_diff = settings.CISCO_GET_DIFF
+    push_config = settings.CISCO_PUSH_CONFIG
+    remote_file = settings.CISCO_REMOTE_FILE_PATCH
+    running_search = settings.CISCO_REGEX_RUNNING_SEARCH
+    capture_start = settings.CISCO_CAPTURE_START
+    capture_end = settings.CISCO_CAPTURE_END
+
+
+class HuaweiDriver(DeviceDriver):
+    os_names = ('huawei', 'huaweiyang')
+    prompt = r'^(<|\[).*({hostname}|\S*)(>|\])$'
+    get_run = settings.HUAWEI_GET_RUN
+    get_diff = settings.HUAWEI_GET_DIFF
+    push_config = settings.HUAWEI_PUSH_CONFIG
+    remote_file = settings.HUAWEI_REMOTE_FILE_PATCH
+    running_search = settings.HUAWEI_REGEX_RUNNING_SEARCH
+    capture_start = settings.HUAWEI_CAPTURE_START
+    capture_end = settings.HUAWEI_CAPTURE_END
+
+
+class JunosDriver(DeviceDriver):
+    os_names = ('junos',)
+    prompt = r'^(\S+@)?({hostname}|\S*)[>#%]$'
+    get_run = settings.JUNIPER_GET_RUN
+    get_diff = settings.JUNIPER_GET_DIFF
+    push_config = settings.JUNIPER_PUSH_CONFIG
+    remote_file = settings.JUNIPER_REMOTE_FILE_PATCH
+    running_search = settings.JUNIPER_REGEX_RUNNING_SEARCH
+    capture_start = settings.JUNIPER_CAPTURE_START
+    capture_end = settings.JUNIPER_CAPTURE_END
+
+
+_drivers = {}
+_instances = {}
+_plugins = {'loaded': False}
+_lock = threading.Lock()
+
+def register_driver(driver_class, os_names=None):
+    '''
+    Use driver_class for every router_os in os_names (driver_class.os_names by
+    default), a later registration of the same name replaces the earlier one
+    '''
+    with _lock:
+        for router_os in os_names or driver_class.os_names:
+            _drivers[router_os] = driver_class
+        for key in [key for key in _instances if key[0] in (os_names or driver_class.os_names)]:
+            del _instances[key]
+
+register_driver(IOSXRDriver)
+register_driver(HuaweiDriver)
+register_driver(JunosDriver)
+
+def load_plugins():
+    '''
+    Import settings.DEVICE_DRIVER_MODULES once, the modules register their drivers
+    '''
+    if _plugins['loaded']:
+        return
+    for module in getattr(settings, 'DEVICE_DRIVER_MODULES', []):
+        logger.debug('DEVICE DRIVER PLUGIN: {0}'.format(module))
+        importlib.import_module(module)
+    _plugins['loaded'] = True
+
+def get_driver_class(router_os, hostname=None):
+    load_plugins()
+    driver_class = _drivers.get(router_os)
+    if driver_class is None:
+        raise UnknownRouterOS(hostname, router_os)
+    return driver_class
+
+def get_driver(data):
+    '''
+    Driver of the router, built on first use. The prompt is the system
+    hostname when known, the inventory name otherwise.
+    '''
+    hostname = data.get('system_hostname') or data['router_hostname']
+    key = (data['router_os'], hostname)
+    driver = _instances.get(key)
+    if driver is None:
+        driver_class = get_driver_class(data['router_os'], data['router_hostname'])
+        driver = driver_class(data['router_os'], hostname)
+        with _lock:
+            driver = _instances.setdefault(key, driver)
+    return driver
@@ -0,0 +1,187 @@
+import sys
+import time
+import threading
+import traceback
+import contextvars
+import concurrent.futures
+from collections import namedtuple, OrderedDict, deque
+import settings
+import metrics
+import logging
+logger = logging.getLogger()
+
+
+RouterResult = namedtuple('RouterResult', ['hostname', 'status', 'output', 'error', 'duration'])
+
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+def get_deadline():
+    '''
+    time.monotonic() by which the router of this thread or task must be done,
+    None without a router timeout
+    '''
+    return _deadline.get()
+
+
+class FleetRunner:
+    '''
+    Run function(router_data) -> output for every router with a bounded thread
+    pool, optional per-OS / per-site concurrency caps and a per-router timeout.
+    The caps are checked when a router is handed to the pool, so a router
+    waiting for its site never holds a worker another site could use.
+    Each router output is written as one block when the router is done, under
+    report_lock when other threads write to the same stream.
+    cleanup(router_data) runs after every router, failed or not.
+    '''
+    def __init__(self, function, max_workers=None, os_limits=None, site_limits=None, timeout=None, stream=None,
+                 cleanup=None, report_lock=None):
+        self.function = function
+        self.cleanup = cleanup
+        self.max_workers = max_workers or settings.FLEET_MAX_WORKERS
+        self.timeout = timeout if timeout is not None else settings.ROUTER_TIMEOUT
+        self.stream = stream if stream is not None else sys.stdout
+        self.report_lock = report_lock if report_lock is not None else threading.Lock()
+        os_limits = os_limits if os_limits is not None else settings.FLEET_OS_LIMITS
+        site_limits = site_limits if site_limits is not None else settings.FLEET_SITE_LIMITS
+        self._limits = {('router_os', name): max(limit, 1) for name, limit in os_limits.items()}
+        self._limits.update({('site', name): max(limit, 1) for name, limit in site_limits.items()})
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def _get_slots(self, router_data):
+        '''
+        The capped (key, value) pairs a router counts against
+        '''
+        return tuple(slot for slot in (('router_os', router_data.get('router_os')), ('site', router_data.get('site')))
+                     if slot in self._limits)
+
+    def _run_router(self, router_data):
+        start = time.monotonic()
+        with self._lock:
+            self._started[router_data['router_hostname']] = start
+        token = _deadline.set(start + self.timeout if self.timeout else None)
+        metrics.set_router(router_data['router_hostname'])
+        try:
+            output = metrics.call(self.function, router_data)
+            return RouterResult(router_data['router_hostname'], 'ok', output, None, time.monotonic() - start)
+        except BaseException as error:
+            logger.error('{0}: {1}'.format(router_data['router_hostname'], traceback.format_exc()))
+            return RouterResult(router_data['router_hostname'], 'failed', None, error, time.monotonic() - start)
+        finally:
+            _deadline.reset(token)
+            if self.cleanup is not None:
+                try:
+                    self.cleanup(router_data)
+                except Exception:
+                    logger.error('{0}: {1}'.format(router_data['router_hostname'], traceback.format_exc()))
+
+    def _next_timeout(self, running):
+        if not self.timeout:
+            return None
+        now = time.monotonic()
+        timeouts = [self.timeout]
+        with self._lock:
+            for router_data in running.values():
+                hostname = router_data['router_hostname']
+                if hostname in self._started:
+                    timeouts.append(self._started[hostname] + self.timeout - now)
+        return max(min(timeouts), 0)
+
+    def _report(self, result):
+        with self.report_lock:
+            report(result, self.stream)
+
+    def _dispatch(self, executor, waiting, active, running, counts):
+        '''
+        Submit waiting routers, earliest first, while a worker is free and
+        their caps allow. waiting maps the slots of a group of routers to a
+        deque of (position, router_data).
+        '''
+        while len(active) < self.max_workers:
+            startable = [slots for slots, queue in waiting.items()
+                         if all(counts.get(slot, 0) < self._limits[slot] for slot in slots)]
+            if not startable:
+                return
+            slots = min(startable, key=lambda slots: waiting[slots][0][0])
+            position, router_data = waiting[slots].popleft()
+            if not waiting[slots]:
+                del waiting[slots]
+            for slot in slots:
+                counts[slot] = counts.get(slot, 0) + 1
+            future = executor.submit(self._run_router, router_data)
+            running[future] = router_data
+            active[future] = slots
+
+    def run(self, routers):
+        '''
+        Returns RouterResult for every router in the order of routers
+        '''
+        results = {}
+        waiting = OrderedDict()
+        for position, router_data in enumerate(routers):
+            waiting.setdefault(self._get_slots(router_data), deque()).append((position, router_data))
+        # active: every submitted future with its slots until its thread is
+        # done, running: the ones not reported yet (not timed out)
+        active = {}
+        running = {}
+        counts = {}
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while waiting or running:
+                self._dispatch(executor, waiting, active, running, counts)
+                done, _ = concurrent.futures.wait(list(active), timeout=self._next_timeout(running),
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    for slot in active.pop(future):
+                        counts[slot] -= 1
+                    if future in running:
+                        del running[future]
+                        result = future.result()
+                        results[result.hostname] = result
+                        self._report(result)
+                now = time.monotonic()
+                for future, router_data in list(running.items()):
+                    hostname = router_data['router_hostname']
+                    with self._lock:
+                        start = self._started.get(hostname)
+                    if self.timeout and start is not None and now - start >= self.timeout:
+                        # the thread keeps its worker and caps until it returns
+                        future.cancel()
+                        result = RouterResult(hostname, 'timeout', None,
+                                              'no result after {0}s'.format(self.timeout), now - start)
+                        results[hostname] = result
+                        self._report(result)
+                        del running[future]
+        finally:
+            executor.shutdown(wait=False)
+        return [results[router_data['router_hostname']] for router_data in routers]
+
+
+def report(result, stream=None):
+    stream = stream if stream is not None else sys.stdout
+    if result.output:
+        stream.write(result.output)
+    if result.status != 'ok':
+        stream.write('\n{0}: {1} {2}\n'.format(result.hostname, result.status.upper(), result.error or ''))
+    stream.flush()
+
+
+def add_fleet_arguments(parser):
+    parser.add_argument('--workers', type=int, default=settings.FLEET_MAX_WORKERS,
+                        help='number of routers handled at the same time')
+    parser.add_argument('--timeout', type=float, default=settings.ROUTER_TIMEOUT,
+                        help='seconds before a router is reported as timed out')
+
+
+def summary(results):
+    '''
+    One line per status with the routers in it, failed routers first
+    '''
+    statuses = {}
+    for result in results:
+        statuses.setdefault(result.status, []).append(result.hostname)
+    lines = []
+    for status in sorted(statuses, key=lambda status: status == 'ok'):
+        lines.append('{0}: {1} ({2})\n'.format(status.upper(), len(statuses[status]), ', '.join(statuses[status])))
+    return ''.join(lines)
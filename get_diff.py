@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 import settings
 import generic
+import fleet
+import metrics
 import yaml
 import sys, os
+import argparse
+import functools
 import warnings
 warnings.filterwarnings(action='ignore',module='.*paramiko.*')
 import sys
@@ -19,56 +23,81 @@ def signal_handler(sig, frame):
 
 signal.signal(signal.SIGINT, signal_handler)
 
-def compare(data):
+def compare(data, offline=False, max_age=None):
 
 
-    # configuration from YAMLs
+    # configuration from YAMLs and render template
 
-    router_vars = generic.get_router_varibles(data)
-    data['system_hostname'] = router_vars['system']['hostname']
-
-    ## render template
-
-    config = generic.render_jinja_template(data, router_vars)
-    config_file = generic.get_file_path(data['router_hostname'], 'rendered.cfg')
-    with open(config_file, "w") as outfile:
-        outfile.write(config)
+    config_file, config = generic.build_router_config(data)
 
     # check what has been updated
-    changet_files = generic.get_changet_files()
-    if generic.if_router_in_changet_files(data, changet_files):
+    change_set = generic.get_change_set()
+    change_set.update_rendered(data, config_file, config)
+    report = []
+    if generic.if_router_in_changet_files(data, change_set):
 
         # compare configurations
-        diff = generic.get_diff_from_router(data, config_file)
-        sys.stdout.write(Fore.CYAN + Style.BRIGHT + "\n##########"+len(data['router_hostname'])*"#"+"################\n")
-        sys.stdout.write(Fore.CYAN + Style.BRIGHT + "| Compare {0} configuration |".format(data['router_hostname']))
-        sys.stdout.write(Fore.CYAN + Style.BRIGHT + "\n##########"+len(data['router_hostname'])*"#"+"################\n")
+        diff = None
+        if offline:
+            diff = generic.get_offline_diff(data, config, max_age)
+        if diff is None:
+            diff = generic.get_diff_from_router(data, config_file)
+        report.append(Fore.CYAN + Style.BRIGHT + "\n##########"+len(data['router_hostname'])*"#"+"################\n")
+        report.append(Fore.CYAN + Style.BRIGHT + "| Compare {0} configuration |".format(data['router_hostname']))
+        report.append(Fore.CYAN + Style.BRIGHT + "\n##########"+len(data['router_hostname'])*"#"+"################\n")
         if diff:
-            sys.stdout.flush()
-            sys.stdout.write(diff)
-            sys.stdout.flush()
+            report.append(diff)
         else:
-            sys.stdout.write('SAME\n')
-            sys.stdout.flush()
-        sys.stdout.write(Fore.CYAN + Style.BRIGHT + "\n##########"+len(data['router_hostname'])*"#"+"###\n")
-        sys.stdout.write(Fore.CYAN + Style.BRIGHT + "| Done for {0} |".format(data['router_hostname']))
-        sys.stdout.write(Fore.CYAN + Style.BRIGHT + "\n##########"+len(data['router_hostname'])*"#"+"###\n")
-    '''
-    '''
+            report.append('SAME\n')
+        report.append(Fore.CYAN + Style.BRIGHT + "\n##########"+len(data['router_hostname'])*"#"+"###\n")
+        report.append(Fore.CYAN + Style.BRIGHT + "| Done for {0} |".format(data['router_hostname']))
+        report.append(Fore.CYAN + Style.BRIGHT + "\n##########"+len(data['router_hostname'])*"#"+"###\n")
+    return ''.join(report)
 
-def prepare_data():
+def prepare_data(args):
     with open(settings.HOSTS_FILE, 'r') as stream:
         try:
             data = yaml.safe_load(stream)
         except yaml.YAMLError as exc:
             print(exc)
-    for router_data in data['routers']:
-        compare(router_data)
+    routers = data['routers']
+    if args.only_affected:
+        routers = generic.select_affected_routers(routers, generic.get_change_set())
+    runner = fleet.FleetRunner(functools.partial(compare, offline=args.offline, max_age=args.max_age),
+                               max_workers=args.workers, timeout=args.timeout,
+                               cleanup=generic.close_router_connection)
+    return runner.run(routers)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    generic.add_data_cache_arguments(parser)
+    fleet.add_fleet_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    generic.add_change_set_arguments(parser)
+    generic.add_impact_arguments(parser)
+    generic.add_incremental_arguments(parser)
+    parser.add_argument('--offline', action='store_true',
+                        help='diff against conf/<host>.current.cfg saved by save_config_all.py instead of the device')
+    parser.add_argument('--max-age', type=float, default=settings.OFFLINE_MAX_AGE,
+                        help='seconds a saved configuration stays usable with --offline before the device is asked')
+    args = parser.parse_args()
+    generic.setup_logging()
+    generic.configure_data_cache(args)
+    metrics.configure_metrics(args)
+    generic.configure_change_set(args)
+    generic.configure_incremental(args)
     sys.stdout.write(Fore.CYAN + Style.BRIGHT + " START \n")
     sys.stdout.flush()
-    prepare_data()
+    try:
+        results = prepare_data(args)
+    finally:
+        generic.close_connections()
+    generic.save_dependencies()
+    generic.save_render_manifest()
+    generic.log_data_cache_stats()
+    metrics.save_run_report(results)
+    sys.stdout.write(Fore.CYAN + Style.BRIGHT + fleet.summary(results))
     sys.stdout.write(Fore.CYAN + Style.BRIGHT + " STOP \n")
     sys.stdout.flush()
-
+    if any(result.status != 'ok' for result in results):
+        sys.exit(1)
@@ -0,0 +1,200 @@
+'''
+Per router, per phase timings of a run. Code in generic wraps its phases in
+timed(), the router is taken from the thread or asyncio task running it, and
+the entry points write every record as a JSONL run report when they are done.
+'''
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager
+import settings
+import logging
+logger = logging.getLogger()
+
+
+_router = contextvars.ContextVar('router', default=None)
+_records = []
+_records_lock = threading.Lock()
+_run = {'start': time.time(), 'clock': time.monotonic(), 'report': None, 'profile': None, 'profiles': [],
+        'pid': os.getpid(), 'worker': False}
+
+
+def set_router(hostname):
+    '''
+    Router the phases timed from now on in this thread or task belong to
+    '''
+    _router.set(hostname)
+
+
+def get_router():
+    return _router.get()
+
+
+def record(phase, duration, **fields):
+    entry = {'router': _router.get(), 'phase': phase, 'start': round(time.monotonic() - _run['clock'] - duration, 6),
+             'duration': round(duration, 6)}
+    entry.update(fields)
+    with _records_lock:
+        _records.append(entry)
+
+
+@contextmanager
+def timed(phase, **fields):
+    '''
+    with timed('render') as fields: ... fields['bytes'] = len(config)
+    '''
+    start = time.monotonic()
+    try:
+        yield fields
+    finally:
+        record(phase, time.monotonic() - start, **fields)
+
+
+class ProfileStats:
+    '''
+    cProfile stats of a worker process, picklable unlike cProfile.Profile and
+    accepted by pstats.Stats like one
+    '''
+    def __init__(self, profiles):
+        self.stats = pstats.Stats(*profiles).stats
+
+    def create_stats(self):
+        pass
+
+
+def take_records():
+    '''
+    Records so far, removed from this process. A worker process hands them to
+    the parent which adds them with add_records, its profile stats go along.
+    '''
+    with _records_lock:
+        records = list(_records)
+        del _records[:]
+        if _run['worker'] and _run['profiles']:
+            records.append({'profile': ProfileStats(_run['profiles'])})
+            del _run['profiles'][:]
+    return records
+
+
+def add_records(records):
+    with _records_lock:
+        for entry in records:
+            if 'profile' in entry:
+                _run['profiles'].append(entry['profile'])
+            else:
+                _records.append(entry)
+
+
+def start_worker_profile():
+    '''
+    In a process forked from the one --profile was given to, the profiler of
+    the parent came along with its data: stop it and profile from scratch
+    '''
+    with _records_lock:
+        if _run['worker']:
+            return
+        if _run['profiles']:
+            _run['profiles'][0].disable()
+        del _run['profiles'][:]
+        _run['worker'] = True
+
+
+def call(function, *args):
+    '''
+    function(*args), under its own profiler when --profile is on, as cProfile
+    before Python 3.12 only sees the thread it was enabled in and no profiler
+    sees a forked worker process
+    '''
+    if _run['profile'] is None:
+        return function(*args)
+    if os.getpid() != _run['pid']:
+        start_worker_profile()
+    elif sys.version_info >= (3, 12):
+        return function(*args)
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(function, *args)
+    finally:
+        with _records_lock:
+            _run['profiles'].append(profile)
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument('--report', default=None,
+                        help='JSONL run report file, a new file in {0} by default'.format(settings.RUN_REPORT_DIRECTORY))
+    parser.add_argument('--profile', default=None,
+                        help='write cProfile stats of the run to this file')
+
+
+def configure_metrics(args):
+    _run['report'] = args.report
+    if args.profile:
+        _run['profile'] = args.profile
+        profile = cProfile.Profile()
+        _run['profiles'].append(profile)
+        profile.enable()
+
+
+def get_report_file():
+    if _run['report']:
+        return _run['report']
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0] or 'run'
+    return os.path.join(settings.RUN_REPORT_DIRECTORY, '{0}-{1}.jsonl'.format(
+        script, time.strftime('%Y%m%d-%H%M%S', time.localtime(_run['start']))))
+
+
+def get_phase_totals(records):
+    totals = {}
+    for entry in records:
+        total = totals.setdefault(entry['phase'], {'phase': entry['phase'], 'count': 0, 'duration': 0.0, 'bytes': 0})
+        total['count'] += 1
+        total['duration'] += entry['duration']
+        total['bytes'] += entry.get('bytes', 0)
+    for total in totals.values():
+        total['duration'] = round(total['duration'], 6)
+    return sorted(totals.values(), key=lambda total: -total['duration'])
+
+
+def save_profile():
+    if _run['profile'] is None:
+        return
+    _run['profiles'][0].disable()
+    with _records_lock:
+        profiles = list(_run['profiles'])
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+        stats.add(profile)
+    stats.dump_stats(_run['profile'])
+    logger.info('PROFILE: {0}'.format(_run['profile']))
+
+
+def save_run_report(results=()):
+    '''
+    One JSON object per line: the run, every router result (fleet.RouterResult),
+    every timed phase and the total of each phase, slowest first
+    '''
+    save_profile()
+    records = take_records()
+    report_file = get_report_file()
+    os.makedirs(os.path.dirname(os.path.abspath(report_file)), exist_ok=True)
+    with open(report_file + '.tmp', 'w') as outfile:
+        outfile.write(json.dumps({'type': 'run', 'script': os.path.basename(sys.argv[0]), 'argv': sys.argv[1:],
+                                  'start': _run['start'],
+                                  'duration': round(time.monotonic() - _run['clock'], 6),
+                                  'routers': len(results)}) + '\n')
+        for result in results:
+            outfile.write(json.dumps({'type': 'router', 'router': result.hostname, 'status': result.status,
+                                      'duration': round(result.duration, 6),
+                                      'error': None if result.error is None else str(result.error)}) + '\n')
+        for entry in records:
+            outfile.write(json.dumps(dict(entry, type='phase'), default=str) + '\n')
+        for total in get_phase_totals(records):
+            outfile.write(json.dumps(dict(total, type='total')) + '\n')
+    os.replace(report_file + '.tmp', report_file)
+    logger.info('RUN REPORT: {0}'.format(report_file))
+    return report_file
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+'''
+Render every router configuration without device access. Merge and render
+are CPU bound, so routers are spread over a process pool that is forked after
+the global data, the service index and the templates are loaded: workers
+inherit them and keep their Jinja environments for every router they render.
+'''
+import settings
+import generic
+import fleet
+import metrics
+import yaml
+import sys, os
+import time
+import argparse
+import traceback
+import multiprocessing
+import concurrent.futures
+from colorama import init, deinit, Fore, Style
+import logging
+logger = logging.getLogger()
+
+init(autoreset=True)
+
+
+def render(data):
+
+    # configuration from YAMLs and render template
+
+    generic.build_router_config(data)
+    return Fore.CYAN + Style.BRIGHT + '\n{0} configuration rendered\n'.format(data['router_hostname'])
+
+def render_router(data):
+    '''
+    Runs in a worker, returns (fleet.RouterResult, render state, timings).
+    Errors go back as text as not every exception can be pickled.
+    '''
+    metrics.set_router(data['router_hostname'])
+    start = time.monotonic()
+    try:
+        result = fleet.RouterResult(data['router_hostname'], 'ok', metrics.call(render, data), None,
+                                    time.monotonic() - start)
+    except Exception as error:
+        logger.error('{0}: {1}'.format(data['router_hostname'], traceback.format_exc()))
+        result = fleet.RouterResult(data['router_hostname'], 'failed', None, repr(error), time.monotonic() - start)
+    return result, generic.get_render_state(data['router_hostname']), metrics.take_records()
+
+def get_mp_context():
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+def render_fleet(routers, workers=None, chunksize=None):
+    '''
+    RouterResult for every router in the order of routers
+    '''
+    workers = workers or settings.RENDER_WORKERS or os.cpu_count()
+    chunksize = chunksize or settings.RENDER_CHUNKSIZE
+    generic.preload_render_data(routers)
+    if workers == 1:
+        rendered = map(render_router, routers)
+        executor = None
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=get_mp_context())
+        rendered = executor.map(render_router, routers, chunksize=chunksize)
+    results = []
+    try:
+        for result, (dependencies, entry), records in rendered:
+            generic.merge_render_state(result.hostname, dependencies, entry)
+            metrics.add_records(records)
+            fleet.report(result)
+            results.append(result)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return results
+
+def prepare_data(args):
+    with open(settings.HOSTS_FILE, 'r') as stream:
+        try:
+            data = yaml.safe_load(stream)
+        except yaml.YAMLError as exc:
+            print(exc)
+    routers = data['routers']
+    if args.only_affected:
+        routers = generic.select_affected_routers(routers, generic.get_change_set())
+    return render_fleet(routers, args.workers, args.chunksize)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    generic.add_data_cache_arguments(parser)
+    generic.add_change_set_arguments(parser)
+    generic.add_impact_arguments(parser)
+    generic.add_incremental_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    parser.add_argument('--workers', type=int, default=settings.RENDER_WORKERS,
+                        help='render processes, one per CPU by default')
+    parser.add_argument('--chunksize', type=int, default=settings.RENDER_CHUNKSIZE,
+                        help='routers handed to a render process at once')
+    args = parser.parse_args()
+    generic.setup_logging(queue=(get_mp_context() or multiprocessing).Queue())
+    generic.configure_data_cache(args)
+    if args.only_affected:
+        generic.configure_change_set(args)
+    generic.configure_incremental(args)
+    metrics.configure_metrics(args)
+    results = prepare_data(args)
+    generic.save_dependencies()
+    generic.save_render_manifest()
+    generic.log_data_cache_stats()
+    metrics.save_run_report(results)
+    sys.stdout.write(Fore.CYAN + Style.BRIGHT + fleet.summary(results))
+    sys.stdout.flush()
+    if any(result.status != 'ok' for result in results):
+        sys.exit(1)
@@ -0,0 +1,246 @@
+'''
+Jinja2 rendering of router configs, with one environment per OS and the
+render manifest that lets incremental runs skip unchanged routers.
+'''
+import json
+import settings
+import os
+import hashlib
+import threading
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, meta
+import metrics
+from variables import (ANY_TEMPLATE, record_dependencies, get_recorded_dependencies, search_files, get_file_path,
+                       get_directory_yamls, cached_yaml_data, load_yaml_concatenation, refresh_service_index,
+                       get_router_varibles)
+import logging
+logger = logging.getLogger()
+
+_jinja_environments = {}
+_jinja_environments_lock = threading.Lock()
+
+def get_jinja_environment(router_os):
+    '''
+    One Environment per OS for the whole run, compiled templates are kept in
+    the bytecode cache between runs and recompiled when the source changes
+    '''
+    with _jinja_environments_lock:
+        env = _jinja_environments.get(router_os)
+        if env is None:
+            bytecode_cache = None
+            if settings.JINJA_BYTECODE_CACHE_DIRECTORY:
+                os.makedirs(settings.JINJA_BYTECODE_CACHE_DIRECTORY, exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(settings.JINJA_BYTECODE_CACHE_DIRECTORY)
+            env = Environment(loader = FileSystemLoader(searchpath=settings.TEMPLATES_ENVIRONMENT), trim_blocks=True, lstrip_blocks=True,
+                              bytecode_cache=bytecode_cache)
+            _jinja_environments[router_os] = env
+    return env
+#
+def render_jinja_template(data, config_data):
+    '''
+    Using data and Jinja2 to generate config files
+    '''
+    env = get_jinja_environment(data['router_os'])
+    template = env.get_template('global/templates/{0}/main.j2'.format(data['router_os']))
+    record_dependencies(data, get_template_dependencies(data['router_os']))
+    merged_dict = {**data, **config_data}
+    with metrics.timed('render') as fields:
+        rendered_template = template.render(merged_dict)
+        fields['bytes'] = len(rendered_template)
+#    logger.info('RENDERED TEMPLATE \n{0}'.format(rendered_template))
+
+    return rendered_template
+#
+_template_dependencies = {}
+
+def get_template_dependencies(router_os):
+    '''
+    main.j2 and every template it includes, imports or extends. A template
+    name only known at render time adds ANY_TEMPLATE, any .j2 change matters.
+    '''
+    with _jinja_environments_lock:
+        if router_os in _template_dependencies:
+            return _template_dependencies[router_os]
+    env = get_jinja_environment(router_os)
+    names = set()
+    pending = ['global/templates/{0}/main.j2'.format(router_os)]
+    while pending:
+        name = pending.pop()
+        if name in names:
+            continue
+        names.add(name)
+        source = env.loader.get_source(env, name)[0]
+        for reference in meta.find_referenced_templates(env.parse(source)):
+            if reference is None:
+                names.add(ANY_TEMPLATE)
+            else:
+                pending.append(reference)
+    with _jinja_environments_lock:
+        _template_dependencies[router_os] = names
+    return names
+#
+_render_manifest = {'enabled': settings.INCREMENTAL_RENDER}
+_render_manifest_lock = threading.Lock()
+_template_set_hashes = {}
+
+def get_render_manifest_file():
+    return os.path.join(settings.DATA_CACHE_DIRECTORY, 'render-manifest.json')
+#
+def get_render_manifest():
+    with _render_manifest_lock:
+        if 'routers' not in _render_manifest:
+            try:
+                with open(get_render_manifest_file()) as stream:
+                    _render_manifest['routers'] = json.load(stream)
+            except (FileNotFoundError, ValueError):
+                _render_manifest['routers'] = {}
+        return _render_manifest['routers']
+#
+def save_render_manifest():
+    if 'routers' not in _render_manifest:
+        return
+    manifest_file = get_render_manifest_file()
+    os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+    with _render_manifest_lock:
+        with open(manifest_file + '.tmp', 'w') as outfile:
+            json.dump(_render_manifest['routers'], outfile, indent=1, sort_keys=True)
+    os.replace(manifest_file + '.tmp', manifest_file)
+#
+def add_incremental_arguments(parser):
+    parser.add_argument('--incremental', action='store_true', default=settings.INCREMENTAL_RENDER,
+                        help='do not render routers whose variables and templates did not change since the last run')
+#
+def configure_incremental(args):
+    _render_manifest['enabled'] = args.incremental
+#
+def update_data_hash(content_hash, value):
+    if isinstance(value, dict):
+        content_hash.update(b'{')
+        for key, item in sorted(value.items(), key=lambda item: repr(item[0])):
+            content_hash.update(repr(key).encode())
+            update_data_hash(content_hash, item)
+        content_hash.update(b'}')
+    elif isinstance(value, list):
+        content_hash.update(b'[')
+        for item in value:
+            update_data_hash(content_hash, item)
+        content_hash.update(b']')
+    else:
+        content_hash.update(repr(value).encode() + b',')
+#
+def get_template_set_hash(router_os):
+    with _jinja_environments_lock:
+        if router_os in _template_set_hashes:
+            return _template_set_hashes[router_os]
+    env = get_jinja_environment(router_os)
+    names = get_template_dependencies(router_os)
+    if ANY_TEMPLATE in names:
+        names = set(os.path.relpath(fname, settings.TEMPLATES_ENVIRONMENT)
+                    for fname in search_files(settings.TEMPLATES_ENVIRONMENT, '.j2'))
+    content_hash = hashlib.sha256()
+    for name in sorted(names):
+        content_hash.update(name.encode() + b'\0' + env.loader.get_source(env, name)[0].encode() + b'\0')
+    with _jinja_environments_lock:
+        return _template_set_hashes.setdefault(router_os, content_hash.hexdigest())
+#
+def get_render_hash(data, config_data):
+    '''
+    Hash of everything a render depends on: router data, merged variables
+    and the source of every template main.j2 can reach
+    '''
+    content_hash = hashlib.sha256(get_template_set_hash(data['router_os']).encode())
+    update_data_hash(content_hash, data)
+    update_data_hash(content_hash, config_data)
+    return content_hash.hexdigest()
+#
+def write_if_changed(fname, content):
+    '''
+    Keep the file and its mtime when content is already there
+    '''
+    try:
+        with open(fname) as infile:
+            if infile.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(fname, "w") as outfile:
+        outfile.write(content)
+    return True
+#
+def render_router_config(data, config_data):
+    '''
+    Render conf/<host>.rendered.cfg and return (config_file, config). In
+    incremental mode the render is skipped when its input hash is the one
+    stored in the manifest and the file still has the recorded content.
+    '''
+    config_file = get_file_path(data['router_hostname'], 'rendered.cfg')
+    if not _render_manifest['enabled']:
+        config = render_jinja_template(data, config_data)
+        write_if_changed(config_file, config)
+        return config_file, config
+
+    render_hash = get_render_hash(data, config_data)
+    manifest = get_render_manifest()
+    with _render_manifest_lock:
+        entry = manifest.get(data['router_hostname'])
+    if entry and entry['input'] == render_hash:
+        try:
+            with open(config_file) as infile:
+                config = infile.read()
+            if hashlib.sha256(config.encode()).hexdigest() == entry['output']:
+                record_dependencies(data, get_template_dependencies(data['router_os']))
+                logger.info('{0}: rendered configuration is up to date'.format(data['router_hostname']))
+                return config_file, config
+        except FileNotFoundError:
+            pass
+    config = render_jinja_template(data, config_data)
+    write_if_changed(config_file, config)
+    with _render_manifest_lock:
+        manifest[data['router_hostname']] = {'input': render_hash,
+                                             'output': hashlib.sha256(config.encode()).hexdigest()}
+    return config_file, config
+#
+def build_router_config(data):
+    '''
+    Variables, system_hostname and render of a router, the one sequence every
+    entry point uses so they all render with the same data and render hash.
+    Returns (config_file, config) like render_router_config.
+    '''
+    router_vars = get_router_varibles(data)
+    data['system_hostname'] = router_vars['system']['hostname']
+    return render_router_config(data, router_vars)
+#
+def preload_render_data(routers):
+    '''
+    Load what every render shares before worker processes are forked: the
+    global YAML data, the service index and the compiled main.j2 of every OS
+    '''
+    generic_router_yamls_list = get_directory_yamls(os.path.normpath('global/'))
+    cached_yaml_data(generic_router_yamls_list, load_yaml_concatenation, generic_router_yamls_list)
+    refresh_service_index()
+    for router_os in sorted(set(router_data['router_os'] for router_data in routers)):
+        get_jinja_environment(router_os).get_template('global/templates/{0}/main.j2'.format(router_os))
+        get_template_dependencies(router_os)
+        if _render_manifest['enabled']:
+            get_template_set_hash(router_os)
+    if _render_manifest['enabled']:
+        get_render_manifest()
+#
+def get_render_state(hostname):
+    '''
+    (dependencies, manifest entry) a render recorded for hostname, handed back
+    from a worker process to the parent
+    '''
+    dependencies = get_recorded_dependencies(hostname)
+    entry = None
+    if _render_manifest['enabled']:
+        manifest = get_render_manifest()
+        with _render_manifest_lock:
+            entry = manifest.get(hostname)
+    return dependencies, entry
+#
+def merge_render_state(hostname, dependencies, entry):
+    record_dependencies({'router_hostname': hostname}, dependencies)
+    if entry is not None:
+        manifest = get_render_manifest()
+        with _render_manifest_lock:
+            manifest[hostname] = entry
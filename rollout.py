@@ -0,0 +1,176 @@
+'''
+Rollout of a change in waves: a canary, then waves growing by ROLLOUT_GROWTH.
+The routers of the next wave are rendered in a background thread while the
+current wave is pushed, rendering is CPU bound and pushing waits on the
+devices, so both overlap and no device waits for a render. Only routers with
+something to push count in a wave. A wave with too many failures halts the
+rollout, the routers left are reported as skipped.
+'''
+import sys
+import time
+import threading
+import traceback
+import concurrent.futures
+import settings
+import fleet
+import metrics
+import logging
+logger = logging.getLogger()
+
+
+def get_wave_sizes(canary, growth, max_wave=None):
+    '''
+    canary, canary * growth, canary * growth ** 2 ... capped at max_wave
+    '''
+    size = max(canary, 1)
+    while True:
+        yield min(size, max_wave) if max_wave else size
+        size = max(int(size * growth), size + 1)
+
+
+class Rollout:
+    '''
+    prepare(router_data) renders a router and returns what push needs, None
+    when there is nothing to push. push(router_data, prepared) returns the
+    router output and runs in a fleet.FleetRunner built with runner_options.
+    '''
+    def __init__(self, prepare, push, canary=None, growth=None, max_wave=None, max_failures=None,
+                 max_failure_ratio=None, pause=None, stream=None, **runner_options):
+        self.prepare = prepare
+        self.push = push
+        self.canary = canary if canary is not None else settings.ROLLOUT_CANARY
+        self.growth = growth if growth is not None else settings.ROLLOUT_GROWTH
+        self.max_wave = max_wave if max_wave is not None else settings.ROLLOUT_MAX_WAVE
+        self.max_failures = max_failures if max_failures is not None else settings.ROLLOUT_MAX_FAILURES
+        self.max_failure_ratio = (max_failure_ratio if max_failure_ratio is not None
+                                  else settings.ROLLOUT_MAX_FAILURE_RATIO)
+        self.pause = pause if pause is not None else settings.ROLLOUT_PAUSE
+        self.stream = stream if stream is not None else sys.stdout
+        self._report_lock = threading.Lock()
+        self.runner = fleet.FleetRunner(self._push, stream=self.stream, report_lock=self._report_lock,
+                                        **runner_options)
+        self.halted = None
+        self._prepared = {}
+        self._halt = threading.Event()
+
+    def _push(self, router_data):
+        return self.push(router_data, self._prepared.pop(router_data['router_hostname']))
+
+    def _prepare_router(self, router_data):
+        '''
+        None when the router goes in a wave, its RouterResult otherwise
+        '''
+        hostname = router_data['router_hostname']
+        metrics.set_router(hostname)
+        start = time.monotonic()
+        try:
+            prepared = metrics.call(self.prepare, router_data)
+        except Exception as error:
+            logger.error('{0}: {1}'.format(hostname, traceback.format_exc()))
+            return fleet.RouterResult(hostname, 'failed', None, error, time.monotonic() - start)
+        if prepared is None:
+            return fleet.RouterResult(hostname, 'ok', None, None, time.monotonic() - start)
+        self._prepared[hostname] = prepared
+        return None
+
+    def _write(self, text):
+        with self._report_lock:
+            self.stream.write(text)
+            self.stream.flush()
+
+    def _next_wave(self, routers, size):
+        '''
+        Prepare routers from the shared iterator until size of them have
+        something to push, runs in the render thread. Returns the wave and
+        the results of the routers with nothing to push or a failed render,
+        the main thread adds those to its results.
+        '''
+        wave = []
+        done = []
+        for router_data in routers:
+            if self._halt.is_set():
+                break
+            result = self._prepare_router(router_data)
+            if result is not None:
+                done.append(result)
+                with self._report_lock:
+                    fleet.report(result, self.stream)
+                continue
+            wave.append(router_data)
+            if len(wave) >= size:
+                break
+        return wave, done
+
+    def check_wave(self, index, wave_results, results):
+        '''
+        Reason to halt after a wave or None: any failure of the canary, more
+        than max_failure_ratio of a wave or more than max_failures in total
+        '''
+        failed = sum(1 for result in wave_results if result.status != 'ok')
+        total = sum(1 for result in results.values() if result.status != 'ok')
+        if index == 0 and failed:
+            return 'canary failed'
+        if failed > self.max_failure_ratio * len(wave_results):
+            return '{0} of {1} routers of wave {2} failed'.format(failed, len(wave_results), index)
+        if self.max_failures is not None and total > self.max_failures:
+            return '{0} routers failed, at most {1} allowed'.format(total, self.max_failures)
+        return None
+
+    def run(self, routers):
+        '''
+        Returns RouterResult for every router in the order of routers, the
+        ones not pushed after a halt have status skipped
+        '''
+        results = {}
+        pending = iter(routers)
+        sizes = get_wave_sizes(self.canary, self.growth, self.max_wave)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        try:
+            next_wave = executor.submit(self._next_wave, pending, next(sizes))
+            index = 0
+            while True:
+                wave, done = next_wave.result()
+                for result in done:
+                    results[result.hostname] = result
+                if not wave:
+                    break
+                next_wave = executor.submit(self._next_wave, pending, next(sizes))
+                self._write('\nWAVE {0}: {1} routers\n'.format(index, len(wave)))
+                with metrics.timed('wave', wave=index, routers=len(wave)) as fields:
+                    wave_results = self.runner.run(wave)
+                    fields['failed'] = sum(1 for result in wave_results if result.status != 'ok')
+                for result in wave_results:
+                    results[result.hostname] = result
+                self.halted = self.check_wave(index, wave_results, results)
+                if self.halted:
+                    self._halt.set()
+                    logger.error('ROLLOUT HALTED after wave {0}: {1}'.format(index, self.halted))
+                    self._write('\nHALTED after wave {0}: {1}\n'.format(index, self.halted))
+                    break
+                index += 1
+                if self.pause:
+                    time.sleep(self.pause)
+        finally:
+            self._halt.set()
+            executor.shutdown(wait=True)
+            self._prepared.clear()
+        if next_wave.done() and next_wave.exception() is None:
+            for result in next_wave.result()[1]:
+                results.setdefault(result.hostname, result)
+        return [results.get(router_data['router_hostname']) or fleet.RouterResult(
+                    router_data['router_hostname'], 'skipped', None, self.halted, 0.0) for router_data in routers]
+
+
+def add_rollout_arguments(parser):
+    parser.add_argument('--canary', type=int, default=settings.ROLLOUT_CANARY,
+                        help='routers in the first wave, any failure there halts the rollout')
+    parser.add_argument('--growth', type=float, default=settings.ROLLOUT_GROWTH,
+                        help='each wave is this many times the previous one (default: %(default)s)')
+    parser.add_argument('--max-wave', type=int, default=settings.ROLLOUT_MAX_WAVE,
+                        help='largest wave, unbounded by default')
+    parser.add_argument('--max-failures', type=int, default=settings.ROLLOUT_MAX_FAILURES,
+                        help='halt when more routers failed in total')
+    parser.add_argument('--max-failure-ratio', type=float, default=settings.ROLLOUT_MAX_FAILURE_RATIO,
+                        help='halt when a larger share of a wave failed (default: %(default)s)')
+    parser.add_argument('--pause', type=float, default=settings.ROLLOUT_PAUSE,
+                        help='seconds to wait between waves')
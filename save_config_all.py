@@ -2,11 +2,15 @@
 import settings
 import sys, os
 import generic
+import fleet
+import metrics
 import yaml
+import argparse
 import warnings
 warnings.filterwarnings(action='ignore',module='.*paramiko.*')
 from colorama import init, deinit, Fore, Style
-import concurrent.futures
+
+init(autoreset=True)
 
 
 def get_configuration_from_router(data):
@@ -18,23 +22,61 @@ def get_configuration_from_router(data):
 
     # get configuration from all routers
 
-    configuration_from_router = generic.get_config_from_router(data)
     old_config_file = generic.get_file_path(data['router_hostname'], 'current.cfg')
-    with open(old_config_file, "w") as outfile:
-        outfile.write(configuration_from_router)
-        sys.stdout.write(Fore.CYAN + Style.BRIGHT +'\n{0} configuration saved\n'.format(data['router_hostname']))
-        sys.stdout.flush()
+    generic.get_config_from_router(data, old_config_file)
+    return Fore.CYAN + Style.BRIGHT +'\n{0} configuration saved\n'.format(data['router_hostname'])
+
+async def get_configuration_from_router_async(data):
+    import aiotransport
+
+    # YAML loading and merge are blocking, keep them off the event loop
+
+    router_vars = await aiotransport.to_thread(generic.get_router_varibles, data)
+    data['system_hostname'] = router_vars['system']['hostname']
+
+    old_config_file = generic.get_file_path(data['router_hostname'], 'current.cfg')
+    await aiotransport.get_config_from_router(data, config_file=old_config_file)
+    return Fore.CYAN + Style.BRIGHT +'\n{0} configuration saved\n'.format(data['router_hostname'])
 
-def prepare_data():
+def prepare_data(args):
     with open(settings.HOSTS_FILE, 'r') as stream:
         try:
             data = yaml.safe_load(stream)
         except yaml.YAMLError as exc:
             print(exc)
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        executor.map(get_configuration_from_router, data['routers'])
+    if args.use_async:
+        import aiotransport
+        results = aiotransport.run(aiotransport.run_fleet(get_configuration_from_router_async, data['routers'],
+                                                          limit=args.sessions, timeout=args.timeout))
+        for result in results:
+            fleet.report(result)
+        return results
+    runner = fleet.FleetRunner(get_configuration_from_router, max_workers=args.workers, timeout=args.timeout,
+                               cleanup=generic.close_router_connection)
+    return runner.run(data['routers'])
 
 
 if __name__ == "__main__":
-    prepare_data()
+    parser = argparse.ArgumentParser()
+    generic.add_data_cache_arguments(parser)
+    fleet.add_fleet_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='back up all routers from one asyncio event loop (needs asyncssh)')
+    parser.add_argument('--sessions', type=int, default=settings.ASYNC_MAX_SESSIONS,
+                        help='open SSH sessions at the same time with --async')
+    args = parser.parse_args()
+    generic.setup_logging()
+    generic.configure_data_cache(args)
+    metrics.configure_metrics(args)
+    try:
+        results = prepare_data(args)
+    finally:
+        generic.close_connections()
+    generic.log_data_cache_stats()
+    metrics.save_run_report(results)
+    sys.stdout.write(Fore.CYAN + Style.BRIGHT + fleet.summary(results))
+    sys.stdout.flush()
+    if any(result.status != 'ok' for result in results):
+        sys.exit(1)
 
@@ -6,20 +6,65 @@ HOME_DIR = os.environ['HOME']
 TEMPLATES_ENVIRONMENT = os.path.join(ROOT_DIR, '')
 CONFIG_FILES_DIRECTORY = ROOT_DIR.path('conf')
 HOSTS_FILE = 'hosts.yaml'
+GIT_DIFF_BASE = 'HEAD~1'
+IMPACT_GLOBAL_FILES = ['hosts.yaml', 'settings.py', 'generic.py', 'variables.py', 'rendering.py', 'changes.py',
+                       'transport.py', 'drivers.py', 'confdiff.py']
 SSH_CONFIG = '~/.ssh/config'
+SSH_KNOWN_HOSTS = None
+TRANSPORT = 'paramiko'
+ASYNC_MAX_SESSIONS = 500
+FLEET_MAX_WORKERS = 5
+FLEET_OS_LIMITS = {}
+FLEET_SITE_LIMITS = {}
+ROUTER_TIMEOUT = None
+ROLLOUT_CANARY = 1
+ROLLOUT_GROWTH = 2
+ROLLOUT_MAX_WAVE = None
+ROLLOUT_MAX_FAILURES = None
+ROLLOUT_MAX_FAILURE_RATIO = 0.1
+ROLLOUT_PAUSE = 0
 LOGLEVEL = 'DEBUG'
+LOG_FILE = 'app.log'
+LOG_DIRECTORY = 'logs'
+TRANSCRIPT_MAX_BYTES = 10 * 1024 * 1024
+TRANSCRIPT_BACKUP_COUNT = 1
+TRANSCRIPT_OPEN_FILES = 256
 LIST_MERGE_KEY = 'merged_list'
+DATA_CACHE_ENABLED = True
+DATA_CACHE_DIRECTORY = os.path.join(ROOT_DIR, '.pynconf-cache')
+DATA_CACHE_VERSION = '1'
+INCREMENTAL_RENDER = False
+RENDER_WORKERS = None
+RENDER_CHUNKSIZE = 8
+JINJA_BYTECODE_CACHE_DIRECTORY = os.path.join(DATA_CACHE_DIRECTORY, 'jinja')
+RUN_REPORT_DIRECTORY = os.path.join(ROOT_DIR, 'reports')
 HUAWEI_REGEX_RUNNING_SEARCH = '(?<=#\r\n).*return'
 CISCO_REGEX_RUNNING_SEARCH = 'hostname.*end'
 JUNIPER_REGEX_RUNNING_SEARCH = '(?<=;\r\n)system.*}'
+HUAWEI_CAPTURE_START = '(?<=#\r\n)'
+HUAWEI_CAPTURE_END = 'return'
+CISCO_CAPTURE_START = 'hostname'
+CISCO_CAPTURE_END = 'end'
+JUNIPER_CAPTURE_START = '(?<=;\r\n)system'
+JUNIPER_CAPTURE_END = '}'
+CAPTURE_WINDOW = 256
+DIFF_CONTEXT = 10
+OFFLINE_MAX_AGE = 24 * 3600
 EXPECT_LIST_ERRORS = ['Error.+',
         '% Invalid.+',
-        '.+^.+',
         '% Incomplete.+',
         '% Unknown.+',
         'bad command.+',
         'failure.+',
         ]
+EXPECT_LIST_ERRORS_OS = {}
+ERROR_MATCH_WINDOW = 512
+EXPECT_CONFIRMATION = [r'\[no\]:\s*$',
+        r'\[[Yy]/[Nn]\]:?\s*$',
+        r'\[yes/no\]:?\s*$',
+        ]
+COMMAND_TIMEOUT = 600
+DEVICE_DRIVER_MODULES = []
 CFG_FILR_NAME = 'gitlab.cfg'
 HUAWEI_REMOTE_FILE_PATCH = CFG_FILR_NAME
 CISCO_REMOTE_FILE_PATCH = 'disk0:/' + CFG_FILR_NAME
@@ -0,0 +1,149 @@
+'''
+select_affected_routers and ChangeSet.update_rendered on a generated fleet in
+a temporary git repo. settings resolve paths against the directory they are
+imported in, so the steps that need the fleet run in a subprocess there.
+'''
+import os
+import sys
+import json
+import shutil
+import subprocess
+import pytest
+import yaml
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, 'bench'))
+import fleetgen
+
+# routers the change selects, then the ones in the change set after they are
+# rendered again the way commit and get_diff do
+SELECT_AND_RENDER = '''
+import sys, json, yaml
+import settings
+import generic
+with open(settings.HOSTS_FILE) as stream:
+    routers = yaml.safe_load(stream)['routers']
+change_set = generic.get_change_set()
+affected = generic.select_affected_routers(routers, change_set)
+for data in affected:
+    data = dict(data)
+    config_file, config = generic.build_router_config(data)
+    change_set.update_rendered(data, config_file, config)
+json.dump({'affected': [data['router_hostname'] for data in affected],
+           'changed': sorted(data['router_hostname'] for data in routers if data['router_hostname'] in change_set)},
+          sys.stdout)
+'''
+
+
+def git(directory, *args):
+    return subprocess.check_output(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.net'] + list(args),
+                                   cwd=directory, stderr=subprocess.STDOUT).decode()
+
+
+def python(directory, *args):
+    # merged keys come out in set order, the same seed renders the same config
+    environment = dict(os.environ, PYTHONPATH=REPO_DIR, PYTHONHASHSEED='0')
+    process = subprocess.run([sys.executable] + list(args), cwd=directory, env=environment, capture_output=True)
+    assert process.returncode == 0, process.stderr.decode()
+    return process.stdout.decode()
+
+
+@pytest.fixture(scope='module')
+def base_fleet(tmp_path_factory):
+    '''
+    Fleet rendered once with its dependencies recorded, committed with the configs
+    '''
+    directory = str(tmp_path_factory.mktemp('fleet'))
+    routers = fleetgen.generate(directory, routers=9, services=4, routers_per_service=3, interfaces=2,
+                                prefix_sets=2, prefixes=3)
+    with open(os.path.join(directory, '.gitignore'), 'w') as outfile:
+        outfile.write('.pynconf-cache/jinja/\n')
+    python(directory, os.path.join(REPO_DIR, 'render_all.py'), '--workers', '1')
+    git(directory, 'init', '-q')
+    git(directory, 'add', '-A')
+    git(directory, 'commit', '-q', '-m', 'base')
+    return directory, routers
+
+
+@pytest.fixture
+def fleet(base_fleet, tmp_path):
+    directory = str(tmp_path / 'fleet')
+    shutil.copytree(base_fleet[0], directory)
+    return directory, base_fleet[1]
+
+
+def commit_and_select(directory):
+    git(directory, 'add', '-A')
+    git(directory, 'commit', '-q', '-m', 'change')
+    return json.loads(python(directory, '-c', SELECT_AND_RENDER))
+
+
+def hostnames(routers, router_os=None):
+    return [router['router_hostname'] for router in routers if router_os in (None, router['router_os'])]
+
+
+def test_nothing_changed(fleet):
+    directory, routers = fleet
+    with open(os.path.join(directory, 'README'), 'w') as outfile:
+        outfile.write('fleet\n')
+    assert commit_and_select(directory) == {'affected': [], 'changed': []}
+
+
+def test_service_edit_selects_its_routers(fleet):
+    directory, routers = fleet
+    fname = os.path.join(directory, 'services', 'l3vpn', 'svc-0001.yaml')
+    with open(fname) as stream:
+        service = yaml.safe_load(stream)
+    members = [key for key in service if key != 'l3vpn']
+    for member in members:
+        for interfaces in service[member]['interfaces'].values():
+            for interface in interfaces.values():
+                interface['mtu'] = 1400
+    fleetgen.write_yaml(fname, service)
+    result = commit_and_select(directory)
+    assert sorted(result['affected']) == sorted(members)
+    assert len(members) < len(routers)
+    assert result['changed'] == sorted(members)
+
+
+def test_new_router_specific_fragment(fleet):
+    directory, routers = fleet
+    hostname = routers[4]['router_hostname']
+    fleetgen.write_yaml(os.path.join(directory, 'router_specific', hostname, '30-system.yaml'),
+                        {'system': {'hostname': hostname, 'domain': 'example.org'}})
+    result = commit_and_select(directory)
+    assert result == {'affected': [hostname], 'changed': [hostname]}
+
+
+def test_template_edit_selects_routers_of_the_os(fleet):
+    directory, routers = fleet
+    fname = os.path.join(directory, 'global', 'templates', 'junos', 'interfaces.j2')
+    with open(fname) as stream:
+        template = stream.read()
+    with open(fname, 'w') as outfile:
+        outfile.write(template + '/* edited */\n')
+    result = commit_and_select(directory)
+    assert result['affected'] == hostnames(routers, 'junos')
+    assert result['changed'] == sorted(hostnames(routers, 'junos'))
+
+
+def test_impact_global_file_selects_every_router(fleet):
+    directory, routers = fleet
+    with open(os.path.join(directory, 'hosts.yaml'), 'a') as outfile:
+        outfile.write('# edited\n')
+    result = commit_and_select(directory)
+    assert result == {'affected': hostnames(routers), 'changed': []}
+
+
+def test_render_identical_to_base_drops_the_host(fleet):
+    directory, routers = fleet
+    edited, reverted = routers[0]['router_hostname'], routers[1]['router_hostname']
+    # a hand edit of a rendered config the render undoes, and a new fragment
+    # whose render is the same config
+    with open(os.path.join(directory, 'conf', edited + '.rendered.cfg'), 'a') as outfile:
+        outfile.write('! hand edit\n')
+    fleetgen.write_yaml(os.path.join(directory, 'router_specific', reverted, '30-snmp.yaml'),
+                        {'snmp': {'community': 'unused'}})
+    result = commit_and_select(directory)
+    assert sorted(result['affected']) == sorted([edited, reverted])
+    assert result['changed'] == []
@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import asyncio
+import pytest
+import settings
+import transport
+import aiotransport
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_routers(count, sites=None):
+    routers = []
+    for index in range(count):
+        router_data = {'router_hostname': 'r{0:02d}'.format(index), 'router_os': 'iosxr' if index % 2 else 'junos'}
+        if sites:
+            router_data['site'] = 's{0}'.format(index * sites // count)
+        routers.append(router_data)
+    return routers
+
+
+class Tracker:
+    '''
+    Coroutine function for run_fleet that records how many routers of each site and OS run at once
+    '''
+    def __init__(self, duration, slow=(), slow_duration=10):
+        self.duration = duration
+        self.slow = set(slow)
+        self.slow_duration = slow_duration
+        self.running = {}
+        self.peak = {}
+
+    async def __call__(self, router_data):
+        keys = [router_data.get('site'), router_data['router_os']]
+        for key in keys:
+            self.running[key] = self.running.get(key, 0) + 1
+            self.peak[key] = max(self.peak.get(key, 0), self.running[key])
+        try:
+            await asyncio.sleep(self.slow_duration if router_data['router_hostname'] in self.slow else self.duration)
+        finally:
+            for key in keys:
+                self.running[key] -= 1
+        return router_data['router_hostname']
+
+
+def test_run_fleet_applies_os_and_site_caps():
+    tracker = Tracker(0.02)
+    routers = make_routers(12, sites=3)
+    results = aiotransport.run(aiotransport.run_fleet(tracker, routers, limit=10, os_limits={'iosxr': 2},
+                                                      site_limits={'s0': 1}))
+    assert [result.hostname for result in results] == [router_data['router_hostname'] for router_data in routers]
+    assert all(result.status == 'ok' and result.output == result.hostname for result in results)
+    assert tracker.peak['iosxr'] == 2
+    assert tracker.peak['s0'] == 1
+    assert tracker.peak['s1'] > 1
+    assert tracker.peak['junos'] > 2
+
+
+def test_run_fleet_timeout():
+    tracker = Tracker(0.01, slow=['r01'])
+    start = time.monotonic()
+    results = aiotransport.run(aiotransport.run_fleet(tracker, make_routers(4), timeout=0.2))
+    assert time.monotonic() - start < 2
+    assert [result.status for result in results] == ['ok', 'timeout', 'ok', 'ok']
+    assert tracker.running['iosxr'] == 0
+
+
+def test_run_fleet_reports_failures():
+    async def function(router_data):
+        if router_data['router_hostname'] == 'r02':
+            raise RuntimeError('boom')
+        return ''
+
+    results = aiotransport.run(aiotransport.run_fleet(function, make_routers(3), os_limits={}, site_limits={}))
+    assert [result.status for result in results] == ['ok', 'ok', 'failed']
+    assert isinstance(results[2].error, RuntimeError)
+
+
+@pytest.fixture
+def fake_router(tmp_path, monkeypatch):
+    '''
+    (data, fake device fleet) for one iosxr router reached through asyncssh
+    '''
+    pytest.importorskip('asyncssh')
+    sys.path.insert(0, os.path.join(REPO_DIR, 'bench'))
+    import fakedevice
+    import run
+    data = {'router_hostname': 'aio-r1', 'router_os': 'iosxr', 'system_hostname': 'aio-r1'}
+    device_fleet = fakedevice.FakeFleet([fakedevice.FakeDevice(data['router_hostname'], data['router_os'])])
+    port = device_fleet.start()
+    known_hosts = str(tmp_path / 'known_hosts')
+    with open(known_hosts, 'w') as outfile:
+        outfile.write('[127.0.0.1]:{0} {1} {2}\n'.format(port, device_fleet.host_key.get_name(),
+                                                         device_fleet.host_key.get_base64()))
+    monkeypatch.setattr(settings, 'SSH_CONFIG', run.write_ssh_config(str(tmp_path), [data], port))
+    monkeypatch.setattr(settings, 'SSH_KNOWN_HOSTS', known_hosts)
+    monkeypatch.setattr(settings, 'TRANSPORT', 'asyncssh')
+    try:
+        yield data, device_fleet
+    finally:
+        transport.close_connections()
+        device_fleet.stop()
+
+
+def test_sync_calls_share_one_connection(fake_router, tmp_path):
+    data, device_fleet = fake_router
+    config_file = str(tmp_path / 'aio-r1.rendered.cfg')
+    with open(config_file, 'w') as outfile:
+        outfile.write('hostname aio-r1\n!\ninterface Bundle-Ether1\n mtu 9100\n!\nend\n')
+    transport.push_config_to_router(data, config_file)
+    assert 'mtu 9100' in transport.get_config_from_router(data)
+    transport.get_config_from_router(data, str(tmp_path / 'aio-r1.current.cfg'))
+    assert len(device_fleet._transports) == 1
+    session = aiotransport._session_pool.get(data['router_hostname'])
+    transport.close_router_connection(data)
+    assert session.loop.is_closed() and session.connection is None
+    # the next step of another workflow connects again
+    assert 'mtu 9100' in transport.get_config_from_router(data)
+    assert len(device_fleet._transports) == 2
@@ -0,0 +1,126 @@
+import random
+import difflib
+import confdiff
+
+
+IOSXR_BEFORE = '''hostname r1
+!
+prefix-set PS-A
+  10.0.0.0/8
+end-set
+!
+route-policy RP-A
+  pass
+end-policy
+!
+end
+'''
+
+
+def test_end_lines_belong_to_their_block():
+    blocks = confdiff.parse_blocks(IOSXR_BEFORE, 'iosxr')
+    assert [header for header, lines in blocks] == ['hostname r1', 'prefix-set PS-A', 'route-policy RP-A', 'end']
+    assert blocks[1][1] == ['prefix-set PS-A', '  10.0.0.0/8', 'end-set']
+    assert blocks[2][1][-1] == 'end-policy'
+
+
+def test_added_prefix_set_is_one_hunk():
+    after = IOSXR_BEFORE.replace('end\n', 'prefix-set PS-B\n  10.1.0.0/16\nend-set\n!\nend\n')
+    diff = confdiff.diff_configs(IOSXR_BEFORE, after, 'iosxr')
+    assert diff.splitlines() == ['--- delete', '+++ add', '@@ prefix-set PS-B @@',
+                                 '+prefix-set PS-B', '+  10.1.0.0/16', '+end-set']
+
+
+def test_changed_prefix_set_keeps_end_set_unchanged():
+    after = IOSXR_BEFORE.replace('  10.0.0.0/8\n', '  10.0.0.0/8,\n  172.16.0.0/12\n')
+    lines = confdiff.diff_configs(IOSXR_BEFORE, after, 'iosxr', context=1).splitlines()
+    assert lines[2] == '@@ prefix-set PS-A @@'
+    assert '-  10.0.0.0/8' in lines and '+  172.16.0.0/12' in lines
+    assert ' end-set' in lines
+    assert not any(line.startswith('@@ end-set') for line in lines)
+
+
+HUAWEI_BEFORE = '''sysname r1
+#
+ntp unicast-server 192.0.2.1
+#
+interface GigabitEthernet0/1/0
+ ip address 192.0.2.10 255.255.255.0
+#
+return
+'''
+
+
+def test_flat_statements_have_no_repeated_header():
+    after = HUAWEI_BEFORE.replace('ntp unicast-server 192.0.2.1\n', 'ntp unicast-server 192.0.2.1\n'
+                                  'ntp unicast-server 192.0.2.2\nsnmp-agent\n')
+    diff = confdiff.diff_configs(HUAWEI_BEFORE, after, 'huawei')
+    assert diff.splitlines() == ['--- delete', '+++ add', '@@ @@',
+                                 '+ntp unicast-server 192.0.2.2', '+snmp-agent']
+
+
+def test_flat_statements_next_to_a_block_hunk():
+    after = HUAWEI_BEFORE.replace(' ip address 192.0.2.10 255.255.255.0\n', ' ip address 192.0.2.11 255.255.255.0\n')
+    after = after.replace('ntp unicast-server 192.0.2.1\n', '')
+    lines = confdiff.diff_configs(HUAWEI_BEFORE, after, 'huawei').splitlines()
+    assert lines[2:] == ['@@ @@', '-ntp unicast-server 192.0.2.1',
+                         '@@ interface GigabitEthernet0/1/0 @@',
+                         ' interface GigabitEthernet0/1/0',
+                         '- ip address 192.0.2.10 255.255.255.0',
+                         '+ ip address 192.0.2.11 255.255.255.0']
+
+
+def test_same_config_gives_empty_diff():
+    assert confdiff.diff_configs(IOSXR_BEFORE, IOSXR_BEFORE, 'iosxr') == ''
+
+
+def test_moved_block_is_not_a_change():
+    moved = IOSXR_BEFORE.replace('prefix-set PS-A\n  10.0.0.0/8\nend-set\n!\n', '')
+    moved = moved.replace('end\n', 'prefix-set PS-A\n  10.0.0.0/8\nend-set\n!\nend\n')
+    assert confdiff.diff_configs(IOSXR_BEFORE, moved, 'iosxr') == ''
+
+
+def check_opcodes(a, b, opcodes):
+    i = j = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j)
+        assert i1 <= i2 and j1 <= j2 and (i1 < i2 or j1 < j2)
+        if tag == 'equal':
+            assert a[i1:i2] == b[j1:j2]
+        elif tag == 'replace':
+            assert i1 < i2 and j1 < j2
+        elif tag == 'delete':
+            assert j1 == j2
+        else:
+            assert tag == 'insert' and i1 == i2
+        i, j = i2, j2
+    assert (i, j) == (len(a), len(b))
+
+
+def test_opcodes_cover_both_sides():
+    rng = random.Random(0)
+    for _ in range(500):
+        a = [rng.randrange(8) for _ in range(rng.randrange(30))]
+        b = list(a)
+        for _ in range(rng.randrange(6)):
+            position = rng.randrange(len(b) + 1)
+            if b and rng.random() < 0.5:
+                del b[min(position, len(b) - 1)]
+            else:
+                b.insert(position, rng.randrange(12))
+        opcodes = confdiff.get_opcodes(a, b)
+        check_opcodes(a, b, opcodes)
+        rebuilt = []
+        for tag, i1, i2, j1, j2 in opcodes:
+            rebuilt.extend(a[i1:i2] if tag == 'equal' else b[j1:j2])
+        assert rebuilt == b
+
+
+def test_diff_lines_applies_like_difflib():
+    before = ['interface {0}'.format(index) for index in range(40)]
+    after = before[:10] + ['interface new'] + before[12:]
+    lines = confdiff.diff_lines(before, after, len(before))
+    assert [line[1:] for line in lines if line[0] in ' -'] == before
+    assert [line[1:] for line in lines if line[0] in ' +'] == after
+    assert sum(line[0] != ' ' for line in lines) == sum(
+        line[0] in '+-' for line in difflib.ndiff(before, after))
@@ -0,0 +1,176 @@
+import io
+import os
+import re
+import random
+import pytest
+import settings
+import transport
+from transport import ConfigCapture
+
+DATA = {'router_hostname': 'r1', 'router_os': 'iosxr', 'system_hostname': 'r1'}
+
+
+def device_output(lines, prompt):
+    return '\r\n'.join(lines).replace('{prompt}', prompt) + '\r\n' + prompt
+
+
+IOSXR = device_output([
+    'RP/0/RSP0/CPU0:r1#terminal length 0',
+    '{prompt}sh run',
+    'Mon Jan  1 00:00:00.000 UTC',
+    'Building configuration...',
+    '!! IOS XR Configuration 6.5.3',
+    '!! Last configuration change by pnba',
+    'hostname r1',
+    'domain name example.net',
+    '!',
+    'interface Bundle-Ether1.100',
+    ' description customer VRF-0001 été',
+    ' vrf VRF-0001',
+    ' ipv4 address 100.0.1.1 255.255.255.252',
+    '!',
+    'prefix-set PS-001',
+    '  10.0.0.0/8,',
+    '  172.16.0.0/12',
+    'end-set',
+    '!',
+    'route-policy RP-end',
+    '  pass',
+    'end-policy',
+    '!',
+    'end',
+    '',
+], 'RP/0/RSP0/CPU0:r1#')
+
+HUAWEI = device_output([
+    '<r1>screen-length 0 temporary',
+    'Info: The configuration takes effect on the current user terminal interface only.',
+    '<r1>display current-configuration',
+    '!Software Version V800R011C00SPC607B607',
+    '!Last configuration was updated by pnba',
+    '#',
+    'sysname r1',
+    '#',
+    'ntp unicast-server 192.0.2.1',
+    '#',
+    'interface Eth-Trunk1.100',
+    ' description customer врф return path',
+    ' ip binding vpn-instance VRF-0001',
+    '#',
+    'return',
+    '',
+], '<r1>')
+
+JUNOS = device_output([
+    'pnba@r1> set cli screen-length 0',
+    'Screen length set to 0',
+    '',
+    'pnba@r1> show configuration',
+    '## Last commit: 2026-01-01 00:00:00 UTC by pnba',
+    'version 18.4R3;',
+    'system {',
+    '    host-name r1;',
+    '    ntp {',
+    '        server 192.0.2.1;',
+    '    }',
+    '}',
+    'interfaces {',
+    '    ae1 {',
+    '        description "customer {VRF-0001} ü";',
+    '    }',
+    '}',
+    '',
+], 'pnba@r1> ')
+
+CASES = [
+    ('iosxr', IOSXR, settings.CISCO_REGEX_RUNNING_SEARCH, settings.CISCO_CAPTURE_START, settings.CISCO_CAPTURE_END),
+    ('huawei', HUAWEI, settings.HUAWEI_REGEX_RUNNING_SEARCH, settings.HUAWEI_CAPTURE_START,
+     settings.HUAWEI_CAPTURE_END),
+    ('junos', JUNOS, settings.JUNIPER_REGEX_RUNNING_SEARCH, settings.JUNIPER_CAPTURE_START,
+     settings.JUNIPER_CAPTURE_END),
+]
+
+
+def random_chunks(text, rng, max_size):
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, max_size)
+        yield text[position:position + size]
+        position += size
+
+
+def capture(text, start, end, chunks, window=None):
+    outfile = io.BytesIO()
+    config_capture = ConfigCapture(outfile, start, end, window)
+    for chunk in chunks:
+        config_capture.feed(chunk)
+    size = config_capture.close()
+    assert size == len(outfile.getvalue())
+    return outfile.getvalue()
+
+
+@pytest.mark.parametrize('router_os, output, running_search, start, end', CASES, ids=[case[0] for case in CASES])
+def test_capture_matches_regex_in_random_chunks(router_os, output, running_search, start, end):
+    expected = re.search(running_search, output, re.S).group(0).encode()
+    rng = random.Random(router_os)
+    for max_size in (1, 2, 3, 7, 16, 64, 1024, len(output)):
+        for _ in range(25):
+            assert capture(output, start, end, random_chunks(output, rng, max_size)) == expected
+
+
+@pytest.mark.parametrize('router_os, output, running_search, start, end', CASES, ids=[case[0] for case in CASES])
+def test_capture_with_a_small_window(router_os, output, running_search, start, end):
+    expected = re.search(running_search, output, re.S).group(0).encode()
+    rng = random.Random(router_os)
+    for _ in range(50):
+        assert capture(output, start, end, random_chunks(output, rng, 40), window=16) == expected
+
+
+def test_capture_without_configuration_raises():
+    with pytest.raises(ValueError):
+        capture('RP/0/RSP0/CPU0:r1#', settings.CISCO_CAPTURE_START, settings.CISCO_CAPTURE_END, ['RP/0/RSP0/CPU0:r1#'])
+
+
+def fake_execute(output, error=None):
+    '''
+    transport.execute that feeds output to the sink in chunks and raises error
+    '''
+    def execute(data, cmd_list, sink=None):
+        for position in range(0, len(output), 100):
+            sink(output[position:position + 100])
+        if error is not None:
+            raise error
+        return ''
+    return execute
+
+
+@pytest.mark.parametrize('error', [transport.DeviceError('r1', 'sh run', '% Invalid input', '% Invalid.+'),
+                                   transport.CommandTimeout('r1: no prompt'), EOFError('r1: connection closed')],
+                         ids=['device-error', 'timeout', 'eof'])
+def test_partial_config_is_removed_on_error(tmp_path, monkeypatch, error):
+    config_file = str(tmp_path / 'r1.current.cfg')
+    with open(config_file, 'w') as outfile:
+        outfile.write('previous\n')
+    monkeypatch.setattr(transport, 'execute', fake_execute(IOSXR[:len(IOSXR) // 2], error))
+    with pytest.raises(type(error)):
+        transport.get_config_from_router(DATA, config_file)
+    assert sorted(os.listdir(str(tmp_path))) == ['r1.current.cfg']
+    with open(config_file) as infile:
+        assert infile.read() == 'previous\n'
+
+
+def test_output_without_config_is_removed(tmp_path, monkeypatch):
+    config_file = str(tmp_path / 'r1.current.cfg')
+    monkeypatch.setattr(transport, 'execute', fake_execute(IOSXR[:IOSXR.index('hostname')]))
+    with pytest.raises(ValueError):
+        transport.get_config_from_router(DATA, config_file)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_config_is_written(tmp_path, monkeypatch):
+    config_file = str(tmp_path / 'r1.current.cfg')
+    monkeypatch.setattr(transport, 'execute', fake_execute(IOSXR))
+    assert transport.get_config_from_router(DATA, config_file) == config_file
+    assert os.listdir(str(tmp_path)) == ['r1.current.cfg']
+    with open(config_file, 'rb') as infile:
+        assert infile.read() == re.search(settings.CISCO_REGEX_RUNNING_SEARCH, IOSXR, re.S).group(0).encode()
@@ -0,0 +1,50 @@
+import os
+import pickle
+import variables
+
+
+class Exploit:
+    def __init__(self, marker):
+        self.marker = marker
+
+    def __reduce__(self):
+        return (os.system, ('touch {0}'.format(self.marker),))
+
+
+def write_yaml(tmp_path, text):
+    fname = tmp_path / 'data.yaml'
+    fname.write_text(text)
+    return [str(fname)]
+
+
+def load(files_list):
+    return variables.disk_cached_yaml_data(files_list, variables.load_yaml_concatenation, files_list)
+
+
+def test_disk_cache_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setitem(variables._disk_cache, 'directory', str(tmp_path / 'cache'))
+    files_list = write_yaml(tmp_path, 'system:\n  since: 2024-01-02\n  at: 2024-01-02 03:04:05+01:00\n'
+                                      '  ntp: [192.0.2.1]\n')
+    first = load(files_list)
+    second = load(files_list)
+    assert second == first
+    assert isinstance(second, variables.FrozenDict)
+    assert isinstance(second['system']['ntp'], variables.FrozenList)
+    assert second['system']['since'].year == 2024
+    assert second['system']['at'].utcoffset().total_seconds() == 3600
+
+
+def test_poisoned_cache_entry_is_not_executed(tmp_path, monkeypatch):
+    monkeypatch.setitem(variables._disk_cache, 'directory', str(tmp_path / 'cache'))
+    files_list = write_yaml(tmp_path, 'system:\n  hostname: r1\n')
+    content_hash = variables.get_content_hash(files_list)
+    cache_file = tmp_path / 'cache' / 'data' / content_hash[:2] / (content_hash + '.pickle')
+    cache_file.parent.mkdir(parents=True)
+    marker = tmp_path / 'pwned'
+    cache_file.write_bytes(pickle.dumps(Exploit(marker)))
+
+    data = load(files_list)
+    assert not marker.exists()
+    assert data == {'system': {'hostname': 'r1'}}
+    # the broken entry was replaced with a good one
+    assert load(files_list) == data
@@ -0,0 +1,107 @@
+import sys
+import pytest
+import settings
+import drivers
+import transport
+
+
+def data(router_os, hostname='r1'):
+    return {'router_hostname': hostname, 'router_os': router_os}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    '''
+    Registrations and cached drivers made by a test are undone after it
+    '''
+    monkeypatch.setattr(drivers, '_drivers', dict(drivers._drivers))
+    monkeypatch.setattr(drivers, '_instances', {})
+    monkeypatch.setattr(drivers, '_plugins', {'loaded': False})
+    return drivers
+
+
+@pytest.mark.parametrize('router_os', ['huawei-ne', 'myhuawei', 'HUAWEI', 'iosxr ', 'ios', ''])
+def test_router_os_is_matched_exactly(registry, router_os):
+    with pytest.raises(drivers.UnknownRouterOS) as error:
+        drivers.get_driver(data(router_os))
+    assert error.value.router_os == router_os
+    assert error.value.hostname == 'r1'
+
+
+@pytest.mark.parametrize('router_os, driver_class', [('iosxr', drivers.IOSXRDriver), ('huawei', drivers.HuaweiDriver),
+                                                      ('huaweiyang', drivers.HuaweiDriver),
+                                                      ('junos', drivers.JunosDriver)])
+def test_known_router_os(registry, router_os, driver_class):
+    assert type(drivers.get_driver(data(router_os))) is driver_class
+
+
+def test_unknown_router_os_in_transport(registry):
+    # every per-OS lookup of transport fails the same way, not with a NameError
+    for function in (transport.get_prompt, transport.get_config_commands, transport.get_capture_patterns,
+                     transport.get_error_matcher):
+        with pytest.raises(drivers.UnknownRouterOS, match="r1: no device driver for router_os 'nxos'"):
+            function(data('nxos'))
+    with pytest.raises(drivers.UnknownRouterOS):
+        transport.get_error_patterns('nxos')
+
+
+# not a valid regex as it is
+HOSTNAME = 'lab[1]+(x'
+
+
+@pytest.mark.parametrize('router_os, prompt, other', [
+    ('iosxr', 'RP/0/RSP0/CPU0:lab[1]+(x#', 'RP/0/RSP0/CPU0:lab[1]+(x# x'),
+    ('huawei', '<lab[1]+(x>', '<lab[1]+(x> x'),
+    ('junos', 'pnba@lab[1]+(x>', 'pnba@lab[1]+(x> x'),
+])
+def test_hostname_is_escaped_in_the_prompt(registry, router_os, prompt, other):
+    driver = drivers.get_driver(dict(data(router_os), system_hostname=HOSTNAME))
+    assert driver.prompt_regex.match(prompt)
+    assert transport.is_prompt(prompt, driver.prompt_regex)
+    assert not transport.is_prompt(other, driver.prompt_regex)
+
+
+def test_system_hostname_has_its_own_driver(registry):
+    first = drivers.get_driver(data('iosxr'))
+    assert drivers.get_driver(data('iosxr')) is first
+    renamed = drivers.get_driver(dict(data('iosxr'), system_hostname='r1-new'))
+    assert renamed is not first and renamed.hostname == 'r1-new'
+
+
+def test_registration_replaces_cached_drivers(registry):
+    before = drivers.get_driver(data('iosxr'))
+    junos = drivers.get_driver(data('junos'))
+
+    class LabIOSXRDriver(drivers.IOSXRDriver):
+        errors = ['% Lab error.+']
+
+    drivers.register_driver(LabIOSXRDriver)
+    after = drivers.get_driver(data('iosxr'))
+    assert type(before) is drivers.IOSXRDriver and type(after) is LabIOSXRDriver
+    assert after.error_patterns[-1] == '% Lab error.+'
+    assert transport.get_error_matcher(data('iosxr')).feed('% Lab error: x\r\n') == ('% Lab error: x',
+                                                                                     '% Lab error.+')
+    # drivers of other OSes stay cached
+    assert drivers.get_driver(data('junos')) is junos
+
+
+def test_plugin_module_registers_a_new_os(registry, tmp_path, monkeypatch):
+    (tmp_path / 'nxos_driver.py').write_text(
+        'import drivers\n\n\n'
+        'class NXOSDriver(drivers.DeviceDriver):\n'
+        '    os_names = (\'nxos\',)\n'
+        '    prompt = r\'^({hostname}|\\S*)#$\'\n'
+        '    get_run = [\'terminal length 0\', \'show running-config\']\n'
+        '    running_search = \'hostname.*\'\n'
+        '    capture_start = \'hostname\'\n'
+        '    capture_end = \'\\n\'\n\n\n'
+        'drivers.register_driver(NXOSDriver)\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(settings, 'DEVICE_DRIVER_MODULES', ['nxos_driver'])
+    try:
+        driver = drivers.get_driver(data('nxos', 'n1'))
+        assert type(driver).__name__ == 'NXOSDriver'
+        assert transport.get_prompt(data('nxos', 'n1')).match('n1#')
+        assert transport.get_config_commands(data('nxos', 'n1'))[0] == ['terminal length 0', 'show running-config']
+    finally:
+        sys.modules.pop('nxos_driver', None)
@@ -0,0 +1,58 @@
+import settings
+import transport
+
+
+def feed_all(matcher, chunks):
+    '''
+    (index of the chunk, error) for the first error found, None without one
+    '''
+    for index, chunk in enumerate(chunks):
+        error = matcher.feed(chunk)
+        if error:
+            return index, error
+    return None
+
+
+def test_error_split_between_feeds():
+    matcher = transport.ErrorMatcher(transport.get_error_patterns('iosxr'))
+    assert feed_all(matcher, ["lod disk0:/gitlab.cfg\r\n% Inv", "alid input detected at '^' marker.\r\n"]) == (
+        1, ("% Invalid input detected at '^' marker.", '% Invalid.+'))
+
+
+def test_error_split_in_every_place():
+    text = 'interface Bundle-Ether1\r\n mtu 9100\r\n% Incomplete command.\r\nRP/0/RSP0/CPU0:r1#'
+    for split in range(1, len(text)):
+        matcher = transport.ErrorMatcher(transport.get_error_patterns('iosxr'))
+        index, (line, pattern) = feed_all(matcher, [text[:split], text[split:]])
+        assert pattern == '% Incomplete.+'
+        # found on the first feed only once a character after the pattern prefix is there
+        assert line.startswith('% Incomplete')
+        assert index == (0 if split > text.index('% Incomplete') + len('% Incomplete') else 1)
+
+
+def test_error_split_after_a_long_output():
+    matcher = transport.ErrorMatcher(transport.get_error_patterns('iosxr'), window=64)
+    chunks = ['!\r\n' * 1000, 'bad comm', 'and\r\n']
+    assert feed_all(matcher, chunks) == (2, ('bad command', 'bad command.+'))
+
+
+def test_error_in_the_carried_text_is_reported_once():
+    matcher = transport.ErrorMatcher(transport.get_error_patterns('iosxr'))
+    assert matcher.feed('Error: one\r\n') == ('Error: one', 'Error.+')
+    # a matcher keeps going after an error only when its caller does
+    assert matcher.feed(' two\r\n') is None
+
+
+def test_per_os_patterns_split_between_feeds(monkeypatch):
+    monkeypatch.setattr(settings, 'EXPECT_LIST_ERRORS_OS', {'junos': [r'syntax error, expecting .+'],
+                                                            'huawei': [r'\^\s*\r?\nError: Unrecognized.+']})
+    junos = transport.get_error_matcher({'router_hostname': 'error-test-junos', 'router_os': 'junos'})
+    assert feed_all(junos, ['set interfaces ae1 unit 100 mtu\r\nsyntax error, exp', 'ecting <number>.\r\n']) == (
+        1, ('syntax error, expecting <number>.', r'syntax error, expecting .+'))
+    # a pattern of another OS is not an error here
+    iosxr = transport.get_error_matcher({'router_hostname': 'error-test-iosxr', 'router_os': 'iosxr'})
+    assert feed_all(iosxr, ['syntax error, exp', 'ecting <number>.\r\n']) is None
+    # a pattern spanning lines, split on its line break
+    huawei = transport.ErrorMatcher(transport.get_error_patterns('huawei'))
+    index, (line, pattern) = feed_all(huawei, ['display cur\r\n            ^\r', '\nError: Unrecognized command\r\n'])
+    assert (index, pattern) == (1, r'\^\s*\r?\nError: Unrecognized.+')
@@ -0,0 +1,119 @@
+import io
+import time
+import threading
+import fleet
+
+
+def make_routers(count, sites=None):
+    routers = []
+    for index in range(count):
+        router_data = {'router_hostname': 'r{0:02d}'.format(index), 'router_os': 'iosxr'}
+        if sites:
+            router_data['site'] = 's{0}'.format(index * sites // count)
+        routers.append(router_data)
+    return routers
+
+
+class Tracker:
+    '''
+    function for FleetRunner that records how many routers of each site run at once
+    '''
+    def __init__(self, duration):
+        self.duration = duration
+        self.lock = threading.Lock()
+        self.running = {}
+        self.peak = {}
+
+    def __call__(self, router_data):
+        site = router_data.get('site')
+        with self.lock:
+            self.running[site] = self.running.get(site, 0) + 1
+            self.peak[site] = max(self.peak.get(site, 0), self.running[site])
+        time.sleep(self.duration)
+        with self.lock:
+            self.running[site] -= 1
+        return router_data['router_hostname'] + '\n'
+
+
+def test_results_in_router_order():
+    routers = make_routers(10)
+
+    def function(router_data):
+        time.sleep((10 - int(router_data['router_hostname'][1:])) * 0.01)
+        return router_data['router_hostname']
+
+    results = fleet.FleetRunner(function, max_workers=5, stream=io.StringIO()).run(routers)
+    assert [result.hostname for result in results] == [router_data['router_hostname'] for router_data in routers]
+    assert all(result.status == 'ok' and result.output == result.hostname for result in results)
+
+
+def test_failure_and_cleanup():
+    cleaned = []
+
+    def function(router_data):
+        if router_data['router_hostname'] == 'r01':
+            raise RuntimeError('boom')
+        return ''
+
+    results = fleet.FleetRunner(function, max_workers=2, stream=io.StringIO(),
+                                cleanup=lambda router_data: cleaned.append(router_data['router_hostname'])).run(
+                                    make_routers(3))
+    assert [result.status for result in results] == ['ok', 'failed', 'ok']
+    assert isinstance(results[1].error, RuntimeError)
+    assert sorted(cleaned) == ['r00', 'r01', 'r02']
+
+
+def test_site_caps_do_not_hold_workers():
+    # routers grouped by site like hosts.yaml, one at a time per site
+    routers = make_routers(12, sites=3)
+    tracker = Tracker(0.2)
+    start = time.monotonic()
+    results = fleet.FleetRunner(tracker, max_workers=3, site_limits={'s0': 1, 's1': 1, 's2': 1},
+                                os_limits={}, stream=io.StringIO()).run(routers)
+    elapsed = time.monotonic() - start
+    assert all(result.status == 'ok' for result in results)
+    assert tracker.peak == {'s0': 1, 's1': 1, 's2': 1}
+    assert elapsed < 1.2
+
+
+def test_os_caps():
+    routers = make_routers(6)
+    tracker = Tracker(0.05)
+    fleet.FleetRunner(tracker, max_workers=6, os_limits={'iosxr': 2}, site_limits={},
+                      stream=io.StringIO()).run(routers)
+    assert tracker.peak == {None: 2}
+
+
+def test_timeout_reports_and_deadline():
+    deadlines = {}
+
+    def function(router_data):
+        deadlines[router_data['router_hostname']] = fleet.get_deadline()
+        if router_data['router_hostname'] == 'r00':
+            time.sleep(1)
+        return ''
+
+    routers = make_routers(3)
+    start = time.monotonic()
+    results = fleet.FleetRunner(function, max_workers=3, timeout=0.2, stream=io.StringIO()).run(routers)
+    assert time.monotonic() - start < 0.8
+    assert [result.status for result in results] == ['timeout', 'ok', 'ok']
+    assert all(start < deadline < start + 0.5 for deadline in deadlines.values())
+    assert all('deadline' not in router_data for router_data in routers)
+    assert fleet.get_deadline() is None
+
+
+def test_timed_out_router_keeps_its_cap():
+    routers = make_routers(2, sites=1)
+    started = {}
+
+    def function(router_data):
+        started[router_data['router_hostname']] = time.monotonic()
+        if router_data['router_hostname'] == 'r00':
+            time.sleep(0.5)
+        return ''
+
+    results = fleet.FleetRunner(function, max_workers=2, timeout=0.1, site_limits={'s0': 1}, os_limits={},
+                                stream=io.StringIO()).run(routers)
+    assert [result.status for result in results] == ['timeout', 'ok']
+    assert started['r01'] - started['r00'] >= 0.45
@@ -0,0 +1,7 @@
+import settings
+import generic
+
+
+def test_every_generic_subsystem_forces_a_full_run():
+    modules = set(module + '.py' for module in generic._subsystems)
+    assert modules <= set(settings.IMPACT_GLOBAL_FILES)
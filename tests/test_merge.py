@@ -0,0 +1,151 @@
+import random
+from copy import deepcopy
+from collections import OrderedDict
+import settings
+import variables
+
+DATA = {'router_hostname': 'r1', 'router_os': 'iosxr'}
+MERGE_KEY = settings.LIST_MERGE_KEY
+
+
+# dict_of_dicts_merge and search_for_key before the merge shared subtrees,
+# the reference the current functions must give the same result as
+
+
+def baseline_search_for_key(x, y):
+    z = OrderedDict()
+    overlapping_keys = x.keys() & y.keys()
+    for key in overlapping_keys:
+        try:
+            y[key].keys()
+            x[key].keys()
+            z[key] = baseline_search_for_key(x[key], y[key])
+        except:
+            z[key] = deepcopy(x[key] + y[key])
+    for key in x.keys() - overlapping_keys:
+        z[key] = deepcopy(x[key])
+    for key in y.keys() - overlapping_keys:
+        z[key] = deepcopy(y[key])
+    return z
+
+
+def baseline_merge(x, y, data):
+    z = OrderedDict()
+    overlapping_keys = x.keys() & y.keys()
+    for key in overlapping_keys:
+        if key == 'l3vpn':
+            z[key] = baseline_search_for_key(x[key], y[key])
+        elif x[key].get(MERGE_KEY) or y[key].get(MERGE_KEY):
+            try:
+                z[key] = deepcopy(x[key].get(MERGE_KEY) + y[key].get(MERGE_KEY))
+            except:
+                try:
+                    z[key] = deepcopy(x[key] + y[key].get(MERGE_KEY))
+                except:
+                    z[key] = deepcopy(x[key].get(MERGE_KEY) + y[key])
+        else:
+            try:
+                y[key].keys()
+                x[key].keys()
+                z[key] = baseline_merge(x[key], y[key], data)
+            except:
+                z[key] = deepcopy(y[key])
+    for key in x.keys() - overlapping_keys:
+        z[key] = deepcopy(x[key])
+    for key in y.keys() - overlapping_keys:
+        if key == data['router_hostname']:
+            overlapping_keys = x.keys() & y[key].keys()
+            for o_0 in overlapping_keys:
+                z[o_0] = baseline_merge(x[o_0], y[key][o_0], data)
+            for ykey in y[key].keys() - overlapping_keys:
+                z[ykey] = deepcopy(y[key][ykey])
+        else:
+            z[key] = deepcopy(y[key])
+    return z
+
+
+def plain(value):
+    if isinstance(value, dict):
+        return {key: plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [plain(item) for item in value]
+    return value
+
+
+def outcome(function, layers):
+    try:
+        return 'ok', plain(variables.dict_reduce(function, [deepcopy(layer) for layer in layers], DATA))
+    except Exception as error:
+        return 'error', type(error)
+
+
+def test_merged_list():
+    x = {'prefixes': {MERGE_KEY: ['10.0.0.0/8']}, 'plain': {'a': 1}}
+    y = {'prefixes': {MERGE_KEY: ['172.16.0.0/12']}, 'plain': {'b': 2}}
+    z = variables.dict_of_dicts_merge(variables.freeze(x), variables.freeze(y), DATA)
+    assert plain(z) == plain(baseline_merge(x, y, DATA)) == {'prefixes': ['10.0.0.0/8', '172.16.0.0/12'],
+                                                             'plain': {'a': 1, 'b': 2}}
+    # an already merged list on one side
+    x = {'prefixes': ['10.0.0.0/8']}
+    assert plain(variables.dict_of_dicts_merge(y, x, DATA)) == plain(baseline_merge(y, x, DATA)) == {
+        'prefixes': ['172.16.0.0/12', '10.0.0.0/8'], 'plain': {'b': 2}}
+    # a merged list in the lower layer has no .get, an error in both
+    assert outcome(variables.dict_of_dicts_merge, [x, y]) == outcome(baseline_merge, [x, y]) == ('error', AttributeError)
+
+
+def test_l3vpn_lists_are_concatenated():
+    x = {'l3vpn': {'VRF-A': {'rt': ['65000:1'], 'rd': ['65000:1']}}}
+    y = {'l3vpn': {'VRF-A': {'rt': ['65000:2']}, 'VRF-B': {'rt': ['65000:3']}}}
+    z = variables.dict_of_dicts_merge(variables.freeze(x), variables.freeze(y), DATA)
+    assert plain(z) == plain(baseline_merge(x, y, DATA)) == {
+        'l3vpn': {'VRF-A': {'rt': ['65000:1', '65000:2'], 'rd': ['65000:1']}, 'VRF-B': {'rt': ['65000:3']}}}
+
+
+def test_hostname_section_overrides():
+    x = {'interfaces': {'ge': {'ge-0/0/0': {'mtu': 1500, 'descr': 'a'}}}, 'system': {'ntp': ['192.0.2.1']}}
+    y = {'r1': {'interfaces': {'ge': {'ge-0/0/0': {'mtu': 9100}}}, 'snmp': {'community': 'x'}},
+         'r2': {'interfaces': {'ge': {'ge-0/0/1': {'mtu': 1}}}}}
+    z = variables.dict_of_dicts_merge(variables.freeze(x), variables.freeze(y), DATA)
+    assert plain(z) == plain(baseline_merge(x, y, DATA))
+    # a dict of scalars is taken whole from the upper layer
+    assert plain(z)['interfaces'] == {'ge': {'ge-0/0/0': {'mtu': 9100}}}
+    assert plain(z)['snmp'] == {'community': 'x'}
+    assert 'r1' not in z and 'r2' in z
+
+
+def random_value(rng, depth):
+    kind = rng.random()
+    if depth <= 0 or kind < 0.05:
+        return rng.choice([1, 'a', None, True, ['x'], ['y', 'z']])
+    if kind < 0.2:
+        return {MERGE_KEY: [rng.randrange(5) for _ in range(rng.randrange(1, 3))]}
+    if kind < 0.25:
+        return [rng.randrange(5) for _ in range(rng.randrange(3))]
+    return random_layer(rng, depth - 1)
+
+
+def random_layer(rng, depth):
+    keys = ['a', 'b', 'c', 'l3vpn', 'r1', 'r2', 'interfaces']
+    return {key: random_value(rng, depth) for key in rng.sample(keys, rng.randrange(1, 5))}
+
+
+def test_random_layer_stacks_match_baseline():
+    rng = random.Random(5)
+    for _ in range(3000):
+        layers = [random_layer(rng, 3) for _ in range(rng.randrange(2, 4))]
+        assert outcome(variables.dict_of_dicts_merge, layers) == outcome(baseline_merge, layers), layers
+
+
+def test_unchanged_subtrees_are_shared():
+    x = variables.freeze({'system': {'ntp': ['192.0.2.1']}, 'interfaces': {'ge': {'ge-0/0/0': {'mtu': 1500}},
+                                                                          'ae': {'ae1': {'mtu': 9100}}}})
+    y = variables.freeze({'interfaces': {'ge': {'ge-0/0/1': {'mtu': 1500}}},
+                          'r1': {'snmp': {'community': 'x'}}, 'l3vpn': {'VRF-A': {'rt': ['65000:1']}}})
+    z = variables.dict_of_dicts_merge(x, y, DATA)
+    assert z['system'] is x['system']
+    assert z['interfaces']['ae'] is x['interfaces']['ae']
+    assert z['interfaces']['ge']['ge-0/0/0'] is x['interfaces']['ge']['ge-0/0/0']
+    assert z['interfaces']['ge']['ge-0/0/1'] is y['interfaces']['ge']['ge-0/0/1']
+    assert z['snmp'] is y['r1']['snmp']
+    assert z['l3vpn'] is y['l3vpn']
+    assert z['interfaces'] is not x['interfaces']
@@ -0,0 +1,61 @@
+import os
+import argparse
+import pstats
+import multiprocessing
+import concurrent.futures
+import pytest
+import metrics
+
+
+def parent_work():
+    return sum(range(1000))
+
+
+def worker_work(count):
+    return sum(range(count))
+
+
+def run_in_worker(count):
+    metrics.set_router('r{0}'.format(count))
+    with metrics.timed('work'):
+        output = metrics.call(worker_work, count)
+    return os.getpid(), output, metrics.take_records()
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_forked_worker_profiles_reach_the_parent(tmp_path, monkeypatch):
+    monkeypatch.setitem(metrics._run, 'profiles', [])
+    monkeypatch.setitem(metrics._run, 'profile', None)
+    monkeypatch.setattr(metrics, '_records', [])
+    profile_file = str(tmp_path / 'run.prof')
+    metrics.configure_metrics(argparse.Namespace(report=None, profile=profile_file))
+    try:
+        metrics.call(parent_work)
+        # workers forked after --profile is configured, like render_all.py
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('fork'))
+        with executor:
+            pids = set()
+            for pid, output, records in executor.map(run_in_worker, [10, 20, 30, 40]):
+                pids.add(pid)
+                metrics.add_records(records)
+    finally:
+        metrics.save_profile()
+    assert os.getpid() not in pids
+    records = metrics.take_records()
+    assert sorted(entry['router'] for entry in records) == ['r10', 'r20', 'r30', 'r40']
+    assert all('profile' not in entry for entry in records)
+    calls = {function[2]: stat[0] for function, stat in pstats.Stats(profile_file).stats.items()}
+    assert calls['worker_work'] == 4
+    # the profile of the parent came along with fork, its data is counted once
+    assert calls['parent_work'] == 1
+
+
+def test_take_records_in_the_parent_keeps_its_profiles(monkeypatch):
+    monkeypatch.setitem(metrics._run, 'profiles', [])
+    monkeypatch.setitem(metrics._run, 'profile', 'unused')
+    monkeypatch.setattr(metrics, '_records', [])
+    metrics.call(parent_work)
+    with metrics.timed('work'):
+        pass
+    assert [entry['phase'] for entry in metrics.take_records()] == ['work']
+    assert len(metrics._run['profiles']) == 1
@@ -0,0 +1,133 @@
+import io
+import re
+import time
+import threading
+import itertools
+import rollout
+
+
+def make_routers(count):
+    return [{'router_hostname': 'r{0:02d}'.format(index), 'router_os': 'iosxr'} for index in range(count)]
+
+
+class Stub:
+    '''
+    prepare and push for Rollout: routers in nothing have nothing to push,
+    the ones in render_errors fail to render and the ones in push_errors fail
+    to push
+    '''
+    def __init__(self, nothing=(), render_errors=(), push_errors=(), duration=0.0):
+        self.nothing = set(nothing)
+        self.render_errors = set(render_errors)
+        self.push_errors = set(push_errors)
+        self.duration = duration
+        self.lock = threading.Lock()
+        self.prepared = []
+        self.pushed = []
+
+    def prepare(self, router_data):
+        hostname = router_data['router_hostname']
+        with self.lock:
+            self.prepared.append(hostname)
+        if hostname in self.render_errors:
+            raise ValueError('render ' + hostname)
+        if hostname in self.nothing:
+            return None
+        return 'config ' + hostname
+
+    def push(self, router_data, prepared):
+        hostname = router_data['router_hostname']
+        assert prepared == 'config ' + hostname
+        time.sleep(self.duration)
+        with self.lock:
+            self.pushed.append(hostname)
+        if hostname in self.push_errors:
+            raise RuntimeError('push ' + hostname)
+        return prepared
+
+
+def run(stub, routers, **options):
+    stream = io.StringIO()
+    options.setdefault('max_workers', 4)
+    options.setdefault('canary', 1)
+    options.setdefault('growth', 2)
+    runner = rollout.Rollout(stub.prepare, stub.push, stream=stream, **options)
+    results = runner.run(routers)
+    waves = [int(size) for size in re.findall(r'^WAVE \d+: (\d+) routers$', stream.getvalue(), re.M)]
+    return runner, results, waves
+
+
+def statuses(results):
+    return {result.hostname: result.status for result in results}
+
+
+def test_get_wave_sizes():
+    assert list(itertools.islice(rollout.get_wave_sizes(1, 2), 5)) == [1, 2, 4, 8, 16]
+    assert list(itertools.islice(rollout.get_wave_sizes(1, 2, max_wave=5), 5)) == [1, 2, 4, 5, 5]
+    assert list(itertools.islice(rollout.get_wave_sizes(1, 1.2), 5)) == [1, 2, 3, 4, 5]
+    assert list(itertools.islice(rollout.get_wave_sizes(0, 2), 3)) == [1, 2, 4]
+
+
+def test_waves_count_only_routers_to_push():
+    stub = Stub(nothing=['r01', 'r05'])
+    runner, results, waves = run(stub, make_routers(12))
+    assert runner.halted is None
+    assert waves == [1, 2, 4, 3]
+    assert [result.hostname for result in results] == ['r{0:02d}'.format(index) for index in range(12)]
+    assert all(result.status == 'ok' for result in results)
+    assert sorted(stub.pushed) == sorted(set(statuses(results)) - {'r01', 'r05'})
+    assert results[1].output is None and results[2].output == 'config r02'
+
+
+def test_max_wave():
+    runner, results, waves = run(Stub(), make_routers(10), max_wave=3)
+    assert waves == [1, 2, 3, 3, 1]
+
+
+def test_canary_failure_halts():
+    stub = Stub(push_errors=['r00'], duration=0.05)
+    runner, results, waves = run(stub, make_routers(10))
+    assert runner.halted == 'canary failed'
+    assert waves == [1]
+    assert stub.pushed == ['r00']
+    by_host = statuses(results)
+    assert by_host.pop('r00') == 'failed'
+    assert set(by_host.values()) == {'skipped'}
+    assert all(result.error == 'canary failed' for result in results[1:])
+    # the next wave was rendered while the canary was pushed, still not pushed
+    assert stub.prepared == ['r00', 'r01', 'r02']
+    assert runner._prepared == {}
+
+
+def test_failure_ratio_halts():
+    stub = Stub(push_errors=['r02'])
+    runner, results, waves = run(stub, make_routers(10), max_failure_ratio=0.4)
+    assert runner.halted == '1 of 2 routers of wave 1 failed'
+    assert waves == [1, 2]
+    assert statuses(results)['r02'] == 'failed'
+    assert [result.status for result in results[3:]] == ['skipped'] * 7
+    # at most the ratio of a wave is allowed to fail
+    runner, results, waves = run(Stub(push_errors=['r02']), make_routers(10), max_failure_ratio=0.5)
+    assert runner.halted is None
+    assert waves == [1, 2, 4, 3]
+
+
+def test_max_failures_halts():
+    stub = Stub(push_errors=['r01', 'r03'], render_errors=['r05'])
+    runner, results, waves = run(stub, make_routers(12), max_failure_ratio=1, max_failures=2)
+    assert runner.halted == '3 routers failed, at most 2 allowed'
+    assert waves == [1, 2, 4]
+    by_host = statuses(results)
+    assert [by_host[hostname] for hostname in ('r01', 'r03', 'r05')] == ['failed'] * 3
+    assert isinstance(results[5].error, ValueError)
+    assert [by_host[hostname] for hostname in ('r00', 'r02', 'r04', 'r06', 'r07')] == ['ok'] * 5
+    assert {by_host[hostname] for hostname in ('r08', 'r09', 'r10', 'r11')} == {'skipped'}
+    assert 'r08' not in stub.pushed
+
+
+def test_render_failure_is_reported_not_pushed():
+    stub = Stub(render_errors=['r00'])
+    runner, results, waves = run(stub, make_routers(4), max_failures=1)
+    assert runner.halted is None
+    assert results[0].status == 'failed' and 'r00' not in stub.pushed
+    assert waves == [1, 2]
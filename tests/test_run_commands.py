@@ -0,0 +1,166 @@
+import time
+import socket
+import threading
+import pytest
+import settings
+import transport
+
+DATA = {'router_hostname': 'r1', 'router_os': 'iosxr', 'system_hostname': 'r1'}
+PROMPT = 'RP/0/RSP0/CPU0:r1#'
+
+
+class Channel:
+    '''
+    Local end of the socketpair with the str send() of a paramiko channel
+    '''
+    def __init__(self, sock):
+        self.sock = sock
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def recv(self, size):
+        return self.sock.recv(size)
+
+    def send(self, text):
+        return self.sock.send(text.encode())
+
+    def close(self):
+        self.sock.close()
+
+
+class FakeShell:
+    '''
+    Other end of a socketpair played by script(shell) in a thread
+    '''
+    def __init__(self, script):
+        connection, self.device = socket.socketpair()
+        self.connection = Channel(connection)
+        self.received = []
+        self.thread = threading.Thread(target=self._run, args=(script,), daemon=True)
+        self.thread.start()
+
+    def _run(self, script):
+        try:
+            script(self)
+        except OSError:
+            pass
+
+    def send(self, text, pause=0.0):
+        if pause:
+            time.sleep(pause)
+        self.device.sendall(text.encode())
+
+    def read_command(self):
+        line = b''
+        while not line.endswith(b'\n'):
+            data = self.device.recv(1)
+            if not data:
+                raise OSError('closed')
+            line += data
+        self.received.append(line.decode().rstrip('\n'))
+        return self.received[-1]
+
+    def close(self):
+        self.device.close()
+        self.connection.close()
+
+
+def run(script, cmd_list):
+    shell = FakeShell(script)
+    try:
+        return transport.run_commands(shell.connection, DATA, cmd_list, transport.get_prompt(DATA)), shell
+    finally:
+        shell.thread.join(5)
+        shell.close()
+
+
+def test_prompt_split_across_reads():
+    def script(shell):
+        shell.send('\r\n' + PROMPT[:10])
+        shell.send(PROMPT[10:], pause=0.05)
+        command = shell.read_command()
+        shell.send(command + '\r\nhostname r1\r\nend\r\nRP/0/RSP0', pause=0.05)
+        shell.send('/CPU0:r', pause=0.05)
+        shell.send('1#', pause=0.05)
+
+    output, shell = run(script, ['sh run'])
+    assert shell.received == ['sh run']
+    assert output.endswith('end\r\n' + PROMPT)
+
+
+def test_confirmation_prompt_gets_the_next_command():
+    def script(shell):
+        shell.send('\r\n' + PROMPT)
+        command = shell.read_command()
+        shell.send(command + '\r\nThis commit will replace the entire running configuration.\r\n'
+                   'Do you wish to proceed? [no]: ')
+        command = shell.read_command()
+        shell.send(command + '\r\n' + PROMPT)
+
+    output, shell = run(script, ['commit replace', 'y'])
+    assert shell.received == ['commit replace', 'y']
+    assert output.endswith('y\r\n' + PROMPT)
+
+
+def test_eof_in_the_middle_of_a_command():
+    def script(shell):
+        shell.send('\r\n' + PROMPT)
+        shell.read_command()
+        shell.send('Building configuration...\r\n')
+        shell.device.shutdown(socket.SHUT_WR)
+
+    with pytest.raises(EOFError):
+        run(script, ['sh run'])
+
+
+def test_no_prompt_raises_command_timeout(monkeypatch):
+    monkeypatch.setattr(settings, 'COMMAND_TIMEOUT', 0.3)
+
+    def script(shell):
+        shell.send('\r\n' + PROMPT)
+        shell.read_command()
+        shell.send('Building configuration...\r\n')
+
+    start = time.monotonic()
+    with pytest.raises(transport.CommandTimeout):
+        run(script, ['sh run'])
+    assert time.monotonic() - start < 3
+
+
+def test_device_error_is_raised():
+    def script(shell):
+        shell.send('\r\n' + PROMPT)
+        command = shell.read_command()
+        shell.send(command + "\r\n% Invalid input detected at '^' marker.\r\n" + PROMPT)
+
+    with pytest.raises(transport.DeviceError):
+        run(script, ['lod disk0:/gitlab.cfg'])
+
+
+def test_utf8_character_split_between_reads():
+    text = ' description врф'
+    raw = text.encode()
+    split = raw.index('в'.encode()) + 1
+
+    def script(shell):
+        shell.send('\r\n' + PROMPT)
+        command = shell.read_command()
+        shell.device.sendall((command + '\r\ninterface Bundle-Ether1\r\n').encode() + raw[:split])
+        time.sleep(0.05)
+        shell.device.sendall(raw[split:] + ('\r\n!\r\nend\r\n' + PROMPT).encode())
+
+    output, shell = run(script, ['sh run'])
+    assert text + '\r\n!' in output
+
+
+def test_device_error_split_between_reads():
+    def script(shell):
+        shell.send('\r\n' + PROMPT)
+        command = shell.read_command()
+        shell.send(command + '\r\n% Inv')
+        shell.send("alid input detected at '^' marker.\r\n" + PROMPT, pause=0.05)
+
+    with pytest.raises(transport.DeviceError) as error:
+        run(script, ['lod disk0:/gitlab.cfg'])
+    assert error.value.line == "% Invalid input detected at '^' marker."
@@ -0,0 +1,80 @@
+import os
+import variables
+
+
+def write(directory, name, text):
+    fname = os.path.join(directory, name)
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    with open(fname, 'w') as outfile:
+        outfile.write(text)
+    return fname
+
+
+def baseline_lookup(directory, hostname):
+    '''
+    Files the index must return: every YAML file with hostname as a key, in os.walk order
+    '''
+    return [fname for fname in variables.search_files(directory, 'yaml')
+            if hostname in variables.get_yaml_keys(variables.load_yaml_file(fname))]
+
+
+def make_index(tmp_path, monkeypatch):
+    monkeypatch.setitem(variables._disk_cache, 'directory', str(tmp_path / 'cache'))
+    directory = str(tmp_path / 'services') + '/'
+    os.makedirs(directory)
+    return directory, variables.ServiceIndex(directory)
+
+
+def test_hostname_must_be_a_whole_key(tmp_path, monkeypatch):
+    directory, index = make_index(tmp_path, monkeypatch)
+    write(directory, 'l3vpn/a.yaml', 'l3vpn: {VRF-A: {rd: [1]}}\nlab-iosxr2:\n  interfaces: {}\n')
+    write(directory, 'l3vpn/b.yaml', 'core-lab-iosxr:\n  interfaces: {}\nlab-iosxr-2: {}\n')
+    write(directory, 'l3vpn/c.yaml', 'lab-iosxr:\n  interfaces: {}\n')
+    assert index.lookup('lab-iosxr') == [directory + 'l3vpn/c.yaml']
+    assert index.lookup('lab-iosxr2') == [directory + 'l3vpn/a.yaml']
+
+
+def test_hostname_as_a_value_is_not_a_member(tmp_path, monkeypatch):
+    directory, index = make_index(tmp_path, monkeypatch)
+    write(directory, 'l3vpn/a.yaml', 'l3vpn:\n  VRF-A:\n    peer: lab-iosxr\n    hubs: [lab-iosxr]\n')
+    write(directory, 'l3vpn/b.yaml', 'l3vpn:\n  VRF-B:\n    sites:\n      - lab-iosxr:\n          role: spoke\n')
+    # a nested key counts, like the text search for "hostname:" did
+    assert index.lookup('lab-iosxr') == [directory + 'l3vpn/b.yaml']
+
+
+def test_files_in_os_walk_order(tmp_path, monkeypatch):
+    directory, index = make_index(tmp_path, monkeypatch)
+    for name in ['zz.yaml', 'l3vpn/b.yaml', 'l3vpn/a.yaml', 'a/nested/x.yaml', 'm.yaml', 'skip.txt']:
+        write(directory, name, 'r1:\n  system: {}\n')
+    write(directory, 'l3vpn/c.yaml', 'r2:\n  system: {}\n')
+    assert index.lookup('r1') == baseline_lookup(directory, 'r1')
+    assert len(index.lookup('r1')) == 5
+    assert index.lookup('r2') == [directory + 'l3vpn/c.yaml']
+    assert index.lookup('r3') == []
+
+
+def test_refresh_reads_only_changed_files(tmp_path, monkeypatch):
+    directory, index = make_index(tmp_path, monkeypatch)
+    edited = write(directory, 'l3vpn/a.yaml', 'r1:\n  system: {}\n')
+    deleted = write(directory, 'l3vpn/b.yaml', 'r1:\n  system: {}\nr2: {}\n')
+    kept = write(directory, 'l3vpn/c.yaml', 'r2:\n  system: {}\n')
+    assert index.lookup('r1') == baseline_lookup(directory, 'r1')
+    assert sorted(index.lookup('r1')) == [edited, deleted]
+    assert sorted(index.lookup('r2')) == [deleted, kept]
+
+    read = []
+    cached_yaml_data = variables.cached_yaml_data
+    monkeypatch.setattr(variables, 'cached_yaml_data', lambda files_list, *args: (
+        read.extend(files_list), cached_yaml_data(files_list, *args))[1])
+    index.refresh()
+    assert read == []
+
+    write(directory, 'l3vpn/a.yaml', 'r2:\n  system: {hostname: r2}\n')
+    os.remove(deleted)
+    added = write(directory, 'l3vpn/d.yaml', 'r1: {}\n')
+    index.refresh()
+    assert sorted(read) == sorted([edited, added])
+    assert index.lookup('r1') == [added] == baseline_lookup(directory, 'r1')
+    assert index.lookup('r2') == baseline_lookup(directory, 'r2')
+    assert sorted(index.lookup('r2')) == sorted([edited, kept])
+    assert index.lookup('hostname') == [edited]
@@ -0,0 +1,476 @@
+'''
+SSH side of pynconf: paramiko connections shared per router, interactive
+shell sessions driven by the device prompt, SCP of rendered configs and
+capture of running configs.
+'''
+import re
+import six
+import codecs
+import settings
+import sys, os
+import time
+import select
+import threading
+import confdiff
+import drivers
+import fleet
+import metrics
+from paramiko import SSHClient, SSHConfig, AutoAddPolicy, ProxyCommand, WarningPolicy, agent
+from scp import SCPClient, SCPException
+from variables import get_router_varibles, get_file_path
+import logging
+logger = logging.getLogger()
+
+_ssh_config = {}
+_ssh_config_lock = threading.Lock()
+
+def get_ssh_config():
+    '''
+    ~/.ssh/config is parsed once per run
+    '''
+    with _ssh_config_lock:
+        if 'config' not in _ssh_config:
+            ssh_config = SSHConfig()
+            user_config_file = os.path.expanduser(settings.SSH_CONFIG)
+            try:
+                with open(user_config_file) as f:
+                    ssh_config.parse(f)
+            except FileNotFoundError:
+                print("{} file could not be found. Aborting.".format(user_config_file))
+                sys.exit(1)
+            _ssh_config['config'] = ssh_config
+    return _ssh_config['config']
+
+def get_ssh_key_for_hostt(host):
+    ssh_config = SSHConfig()
+    user_config_file = os.path.expanduser(settings.SSH_CONFIG)
+    if os.path.exists(user_config_file):
+        with open(user_config_file) as f:
+            ssh_config.parse(f)
+
+    user_config = ssh_config.lookup(host)
+    return user_config
+
+def paramiko_connect(host):
+    client = SSHClient()
+    client.load_system_host_keys()
+    client.set_missing_host_key_policy(AutoAddPolicy())
+
+    ssh_config = get_ssh_config()
+    options = ssh_config.lookup(host)
+    sock = None
+    proxycommand = options.get("proxycommand")
+    if hasattr(settings, 'IDENTITYFILE'):
+        key_filename = settings.IDENTITYFILE
+    else:
+        key_filename = options.get("identityfile")
+
+    if hasattr(settings, 'USERNAME'):
+        username = settings.USERNAME
+    else:
+        username = options.get("user")
+    if proxycommand:
+        if not isinstance(proxycommand, six.string_types):
+          proxycommand = [os.path.expanduser(elem) for elem in proxycommand]
+        else:
+          proxycommand = os.path.expanduser(proxycommand)
+        sock = ProxyCommand(proxycommand)
+
+    cfg = {'hostname': options.get('hostname', host),
+           'port': int(options.get('port', 22)),
+           'username': username,
+           'password': None,
+           'look_for_keys': True,
+           'allow_agent': False,
+           'key_filename': key_filename,
+           'pkey': None,
+           'passphrase': None,
+           'timeout': 60,
+           'auth_timeout': None,
+           'banner_timeout': 15,
+           'sock': sock,
+            }
+    return client, cfg
+
+
+class DeviceError(Exception):
+    '''
+    Device output matched one of the EXPECT_LIST_ERRORS patterns
+    '''
+    def __init__(self, hostname, command, line, pattern):
+        self.hostname = hostname
+        self.command = command
+        self.line = line
+        self.pattern = pattern
+        super(DeviceError, self).__init__("* There was at least one syntax error on device {0}: {1!r} after {2!r}".format(
+            hostname, line, command))
+
+class ErrorMatcher:
+    '''
+    Every error pattern of an OS in one compiled regex, fed chunk by chunk.
+    The last ERROR_MATCH_WINDOW characters are carried over to the next
+    chunk so an error split by recv() is still found.
+    '''
+    def __init__(self, patterns, window=None, regex=None):
+        self.patterns = list(patterns)
+        self.regex = regex if regex is not None else drivers.compile_errors(self.patterns)
+        self.window = window or settings.ERROR_MATCH_WINDOW
+        self.carry = ''
+
+    def feed(self, chunk):
+        '''
+        Returns (line, pattern) of the first error that ends in chunk, or None
+        '''
+        text = self.carry + chunk
+        for match in self.regex.finditer(text):
+            if match.end() > len(self.carry):
+                line_start = text.rfind('\n', 0, match.start()) + 1
+                line_end = text.find('\n', match.end())
+                line = text[line_start:line_end if line_end != -1 else len(text)].strip()
+                pattern = next(self.patterns[index] for index in range(len(self.patterns))
+                               if match.group('e{0}'.format(index)) is not None)
+                return line, pattern
+        self.carry = text[-self.window:]
+        return None
+
+def get_error_patterns(router_os):
+    return drivers.get_driver_class(router_os).get_error_patterns(router_os)
+
+def get_error_matcher(data):
+    driver = drivers.get_driver(data)
+    return ErrorMatcher(driver.error_patterns, regex=driver.error_regex)
+
+def check_for_errors(router_output, data, command=None, matcher=None):
+    if matcher is None:
+        matcher = get_error_matcher(data)
+    error = matcher.feed(router_output)
+    if error:
+        raise DeviceError(data['router_hostname'], command, *error)
+
+def get_prompt(data):
+    return drivers.get_driver(data).prompt_regex
+
+_expect_confirmation = re.compile('|'.join('(?:{0})'.format(confirmation) for confirmation in settings.EXPECT_CONFIRMATION))
+
+def is_prompt(last_line, prompt):
+    '''
+    Device waits for input: CLI prompt or a [Y/N] / [no] confirmation question
+    '''
+    last_line = last_line.strip()
+    return bool(prompt.match(last_line) or _expect_confirmation.search(last_line))
+
+
+def get_config_commands(data):
+    driver = drivers.get_driver(data)
+    return driver.get_run, driver.running_search_regex
+
+def get_capture_patterns(data):
+    driver = drivers.get_driver(data)
+    return driver.capture_start_regex, driver.capture_end_regex
+
+class ConfigCapture:
+    '''
+    Streaming version of re.search(regex_running_search, output, re.S): the
+    output is written to outfile (binary) from the first start match on and
+    the file is cut after the last end match in close(). Only a window of
+    CAPTURE_WINDOW characters is kept in memory, whatever the config size.
+    '''
+    def __init__(self, outfile, start, end, window=None):
+        self.outfile = outfile
+        self.start = re.compile(start)
+        self.end = re.compile(end)
+        self.window = window or settings.CAPTURE_WINDOW
+        self.started = False
+        self.carry = ''
+        self.written = 0
+        self.last_end = None
+
+    def feed(self, chunk):
+        text = self.carry + chunk
+        if not self.started:
+            match = self.start.search(text)
+            if match is None:
+                self.carry = text[-self.window:]
+                return
+            self.started = True
+            text = text[match.start():]
+            self.carry = ''
+        text_offset = self.written - len(self.carry.encode())
+        last_match = None
+        for last_match in self.end.finditer(text):
+            pass
+        if last_match is not None:
+            self.last_end = text_offset + len(text[:last_match.end()].encode())
+        new_data = text[len(self.carry):].encode()
+        self.outfile.write(new_data)
+        self.written += len(new_data)
+        self.carry = text[-self.window:]
+
+    def close(self):
+        if self.last_end is None:
+            raise ValueError('no configuration found in the device output')
+        self.outfile.truncate(self.last_end)
+        return self.last_end
+
+def get_config_from_router(data, config_file=None):
+    '''
+    Running configuration as a string, or streamed into config_file when given
+    '''
+    cmd_list, regex_running_search = get_config_commands(data)
+    with metrics.timed('config_fetch') as fields:
+        if config_file is not None:
+            part_file = config_file + '.part'
+            try:
+                with open(part_file, 'wb') as outfile:
+                    capture = ConfigCapture(outfile, *get_capture_patterns(data))
+                    execute(data, cmd_list, sink=capture.feed)
+                    fields['bytes'] = capture.close()
+                os.replace(part_file, config_file)
+            finally:
+                # a timeout, an error or EOF leaves no partial config behind
+                if os.path.exists(part_file):
+                    os.remove(part_file)
+            return config_file
+        router_output = execute(data, cmd_list)
+        router_configuration = regex_running_search.search(router_output)
+        fields['bytes'] = len(router_configuration.group(0))
+        return ''.join(router_configuration.group(0))
+
+_candidate_separators = re.compile(r"\n!\s*\n!\s*|\n!\s*")
+_current_separators = re.compile(r"\n!\s*")
+
+def get_diff_from_router(data, config_file):
+    driver = drivers.get_driver(data)
+    scp_rendered_config(data, config_file, driver.remote_file)
+    router_output = execute(data, driver.get_diff)
+    router_candidat_configuration = driver.running_search_regex.search(router_output)
+    config_file_candidate = get_file_path(data['router_hostname'], 'candidate.cfg')
+    router_candidat_configuration = _candidate_separators.sub(r"\n!\r\n", router_candidat_configuration.group(0))
+    with open(config_file_candidate, "w") as outfile:
+        outfile.write(router_candidat_configuration)
+    if 'system_hostname' not in data:
+        router_vars = get_router_varibles(data)
+        data['system_hostname'] = router_vars['system']['hostname']
+    # the diff needs the whole current config as text, streaming it to disk
+    # first would only add a read back
+    router_current_configuration = _current_separators.sub(r"\n!\r\n", get_config_from_router(data))
+    config_file_current = get_file_path(data['router_hostname'], 'current.cfg')
+    with open(config_file_current, "w") as outfile:
+        outfile.write(router_current_configuration)
+
+    return confdiff.diff_configs(router_current_configuration, router_candidat_configuration, data['router_os'])
+
+def get_offline_diff(data, config, max_age=None):
+    '''
+    Diff of the rendered config against conf/<host>.current.cfg saved by
+    save_config_all.py, None when that file is missing or older than max_age
+    seconds so the caller can fall back to the device
+    '''
+    max_age = settings.OFFLINE_MAX_AGE if max_age is None else max_age
+    config_file_current = get_file_path(data['router_hostname'], 'current.cfg')
+    try:
+        age = time.time() - os.stat(config_file_current).st_mtime
+    except FileNotFoundError:
+        logger.info('{0}: no saved configuration, diff from the device'.format(data['router_hostname']))
+        return None
+    if max_age is not None and age > max_age:
+        logger.info('{0}: saved configuration is {1:.0f}s old, diff from the device'.format(data['router_hostname'], age))
+        return None
+    with open(config_file_current) as infile:
+        router_current_configuration = infile.read()
+    return confdiff.diff_configs(router_current_configuration, config, data['router_os'],
+                                 fromfile='delete (saved {0:.0f}s ago)'.format(age))
+
+def push_config_to_router(data, config_file):
+    driver = drivers.get_driver(data)
+    scp_rendered_config(data, config_file, driver.remote_file)
+    router_output = execute(data, driver.push_config)
+    return router_output
+
+def scp_rendered_config(data, config_file, remote_file_patch):
+    if settings.TRANSPORT == 'asyncssh':
+        import aiotransport
+        return aiotransport.run_sync(data['router_hostname'], aiotransport.scp_rendered_config, data, config_file,
+                                     remote_file_patch)
+    client = get_connection(data['router_hostname'])
+    with metrics.timed('scp', bytes=os.path.getsize(config_file)), SCPClient(client.get_transport()) as scp:
+        try:
+            scp.put(config_file, remote_file_patch)
+        except SCPException as error:
+            logger.error(error)
+            raise error
+
+class CommandTimeout(Exception):
+    pass
+
+def get_command_deadline(data):
+    deadline = time.monotonic() + settings.COMMAND_TIMEOUT
+    router_deadline = fleet.get_deadline()
+    if router_deadline is not None:
+        deadline = min(deadline, router_deadline)
+    return deadline
+
+def execute(data, cmd_list, sink=None):
+    if settings.TRANSPORT == 'asyncssh':
+        import aiotransport
+        return aiotransport.run_sync(data['router_hostname'], aiotransport.execute, data, cmd_list, sink=sink)
+    client = get_connection(data['router_hostname'])
+    prompt = get_prompt(data)
+
+    with LazyConnection(client) as connection:
+        agent.AgentRequestHandler(connection)
+        return run_commands(connection, data, cmd_list, prompt, sink)
+
+def run_commands(connection, data, cmd_list, prompt, sink=None):
+    '''
+    Wait on the channel with select and send the next command as soon as the
+    device shows its prompt. connection is anything with fileno(), recv() and
+    send(), so a local fake shell works as well as a paramiko channel.
+    With sink every chunk goes to sink(chunk) and nothing is kept in memory.
+    Bytes are decoded incrementally, a UTF-8 character split between two
+    reads is completed by the next one.
+    '''
+    return_output = []
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    line = line_gen(cmd_list)
+    cmd = None
+    last_line = ''
+    matcher = get_error_matcher(data)
+    deadline = get_command_deadline(data)
+    command_start = time.monotonic()
+    command_bytes = 0
+    while True:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise CommandTimeout('{0}: no prompt after {1!r} within {2}s'.format(
+                data['router_hostname'], cmd, settings.COMMAND_TIMEOUT))
+        readable, _, _ = select.select([connection], [], [], timeout)
+        if not readable:
+            continue
+        received = connection.recv(99999)
+        if not received:
+            raise EOFError('{0}: channel closed after {1!r}'.format(data['router_hostname'], cmd))
+        command_bytes += len(received)
+        router_output = decoder.decode(received)
+        if not router_output:
+            continue
+        if sink is None:
+            return_output.append(router_output)
+        else:
+            sink(router_output)
+        check_for_errors(router_output, data, cmd, matcher)
+        logger.info('%s', DeviceOutput(data['router_hostname'], router_output))
+        last_line = (last_line + router_output).rsplit('\n', 1)[-1]
+        if is_prompt(last_line, prompt):
+            metrics.record('command', time.monotonic() - command_start, command=cmd, bytes=command_bytes)
+            try:
+                cmd = next(line)
+            except StopIteration:
+                break
+            connection.send(cmd + '\n')
+            last_line = ''
+            deadline = get_command_deadline(data)
+            command_start = time.monotonic()
+            command_bytes = 0
+    return ''.join(return_output)
+
+class DeviceOutput:
+    '''
+    Log argument for a received chunk, cleaned up only when the record is written
+    '''
+    __slots__ = ('hostname', 'chunk')
+
+    def __init__(self, hostname, chunk):
+        self.hostname = hostname
+        self.chunk = chunk
+
+    def __str__(self):
+        return '{0}:\n{1}'.format(self.hostname.upper(), self.chunk.replace('\r', ''))
+
+class LazyConnection:
+    def __init__(self, client):
+        self.client = client
+        self.connection = None
+
+    def __enter__(self):
+        if self.connection is not None:
+            raise RuntimeError('Already connected')
+        self.connection = self.client.invoke_shell('xterm')
+        return self.connection
+
+    def __exit__(self, exc_ty, exc_val, tb):
+        self.connection.close()
+        self.connection = None
+
+class ConnectionPool:
+    '''
+    One authenticated SSH client per router for the whole workflow,
+    scp, shell sessions and show commands open their own channels on it
+    '''
+    def __init__(self):
+        self._clients = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _host_lock(self, host):
+        with self._lock:
+            return self._locks.setdefault(host, threading.Lock())
+
+    def get(self, host):
+        with self._host_lock(host):
+            client = self._clients.get(host)
+            if client is not None:
+                transport = client.get_transport()
+                if transport is not None and transport.is_active():
+                    return client
+                client.close()
+            client, cfg = paramiko_connect(host)
+            with metrics.timed('ssh_connect', host=host):
+                client.connect(**cfg)
+            client.get_transport().set_keepalive(60)
+            self._clients[host] = client
+            return client
+
+    def close(self, host):
+        with self._host_lock(host):
+            client = self._clients.pop(host, None)
+            if client is not None:
+                client.close()
+
+    def close_all(self):
+        with self._lock:
+            hosts = list(self._clients)
+        for host in hosts:
+            self.close(host)
+
+_connection_pool = ConnectionPool()
+
+def get_connection(host):
+    return _connection_pool.get(host)
+
+def close_connection(host):
+    _connection_pool.close(host)
+    if settings.TRANSPORT == 'asyncssh':
+        import aiotransport
+        aiotransport.close_session(host)
+
+def close_router_connection(data):
+    close_connection(data['router_hostname'])
+
+def close_connections():
+    _connection_pool.close_all()
+    if settings.TRANSPORT == 'asyncssh':
+        import aiotransport
+        aiotransport.close_sessions()
+
+def notlast(itr):
+    itr = iter(itr)
+    prev = itr.__next__()
+    for item in itr:
+        yield prev
+        prev = item
+
+def line_gen(itr):
+    itr = iter(itr)
+    for item in itr:
+        yield item
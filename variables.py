@@ -0,0 +1,594 @@
+'''
+Router variables: YAML loading and caching, the service index, merge of the
+data layers, normalization and the record of which inputs a router read.
+'''
+import yaml
+import json
+import re
+import settings
+import os
+import hashlib
+import datetime
+import pickle
+import shutil
+import threading
+import metrics
+from copy import deepcopy
+try:
+    from collections import OrderedDict
+except ImportError: # pragma: no cover # python 2.6 only
+    from ordereddict import OrderedDict
+import logging
+logger = logging.getLogger()
+
+def get_data_for_services(data, files_list):
+
+    generic_config_list_data = []
+    for service_file in files_list:
+        generic_config_list_data.append(cached_yaml_data([service_file], load_yaml_file, service_file))
+
+    return generic_config_list_data
+
+def get_yaml_keys(data, keys=None):
+    if keys is None:
+        keys = set()
+    if isinstance(data, dict):
+        for key, value in data.items():
+            keys.add(key)
+            get_yaml_keys(value, keys)
+    elif isinstance(data, list):
+        for value in data:
+            get_yaml_keys(value, keys)
+    return keys
+#
+class ServiceIndex:
+    '''
+    Inverted index of YAML keys to the service files that contain them,
+    built in one pass over the directory and refreshed only for changed files
+    '''
+    def __init__(self, directory, extension='yaml'):
+        self.directory = directory
+        self.extension = extension
+        self._files = {}
+        self._positions = {}
+        self._index = {}
+        self._built = False
+        self._lock = threading.Lock()
+
+    def _drop(self, fname):
+        signature, keys = self._files.pop(fname)
+        for key in keys:
+            self._index[key].discard(fname)
+
+    def refresh(self):
+        with self._lock:
+            files_list = search_files(self.directory, self.extension)
+            positions = {fname: position for position, fname in enumerate(files_list)}
+            for fname in set(self._files) - set(positions):
+                self._drop(fname)
+            for fname in files_list:
+                signature = get_file_signature(fname)
+                if fname in self._files:
+                    if self._files[fname][0] == signature:
+                        continue
+                    self._drop(fname)
+                keys = get_yaml_keys(cached_yaml_data([fname], load_yaml_file, fname))
+                self._files[fname] = (signature, keys)
+                for key in keys:
+                    self._index.setdefault(key, set()).add(fname)
+            self._positions = positions
+            self._built = True
+
+    def reset(self):
+        with self._lock:
+            self._files = {}
+            self._positions = {}
+            self._index = {}
+            self._built = False
+
+    def lookup(self, key):
+        '''
+        Files that have key as a YAML key, in the same order os.walk lists them
+        '''
+        if not self._built:
+            self.refresh()
+        return sorted(self._index.get(key, ()), key=self._positions.get)
+
+_service_index = ServiceIndex('services/')
+#
+def get_service_files(hostname):
+    with metrics.timed('service_search'):
+        return _service_index.lookup(hostname)
+#
+def refresh_service_index():
+    _service_index.refresh()
+
+#
+def search_files(directory, extension):
+    output_list = []
+    extension = extension.lower()
+    for dirpath, dirnames, files in os.walk(directory):
+        for name in files:
+            if extension and name.lower().endswith(extension):
+                output_list.append(os.path.join(dirpath, name))
+    return output_list
+#
+def get_directory_yamls(generic_dir):
+    generic_router_yamls_list = get_files_list(generic_dir)
+    sort_nicely(generic_router_yamls_list)
+    return [generic_dir+'/'+fname for fname in generic_router_yamls_list]
+#
+def get_data_from_directories(data, directory, subdirectory=None):
+
+    if subdirectory:
+        directory = directory + subdirectory
+    generic_dir = os.path.normpath(directory)
+    generic_router_yamls_list = get_directory_yamls(generic_dir)
+    record_dependencies(data, [generic_dir+'/'] + generic_router_yamls_list)
+
+    return cached_yaml_data(generic_router_yamls_list, load_yaml_concatenation, generic_router_yamls_list)
+#
+def load_yaml_file(fname):
+    with open(fname, 'r') as stream:
+        try:
+            return yaml.safe_load(stream)
+        except yaml.YAMLError as exc:
+            print(exc)
+#
+class ConcatenatedStream:
+    '''
+    Read-only stream over several files one after another, yaml.safe_load
+    gets the same text as from the files concatenated on disk
+    '''
+    def __init__(self, files_list):
+        self.name = ', '.join(files_list)
+        self._files = iter(files_list)
+        self._current = None
+
+    def read(self, size=-1):
+        chunks = []
+        while size != 0:
+            if self._current is None:
+                fname = next(self._files, None)
+                if fname is None:
+                    break
+                self._current = open(fname, 'r')
+            chunk = self._current.read(size)
+            if not chunk:
+                self._current.close()
+                self._current = None
+                continue
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return ''.join(chunks)
+
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_ty, exc_val, tb):
+        self.close()
+#
+def load_yaml_concatenation(files_list):
+    with ConcatenatedStream(files_list) as stream:
+        try:
+            return yaml.safe_load(stream)
+        except yaml.YAMLError as exc:
+            print(exc)
+#
+class FrozenDict(dict):
+    '''
+    Read-only dict handed out by the data cache, deepcopy() returns a writable copy
+    '''
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('cached YAML data is shared between routers, deepcopy it before changing')
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __deepcopy__(self, memo):
+        return OrderedDict((key, deepcopy(value, memo)) for key, value in self.items())
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+#
+class FrozenList(list):
+    '''
+    Read-only list handed out by the data cache, deepcopy() returns a writable copy
+    '''
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('cached YAML data is shared between routers, deepcopy it before changing')
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __deepcopy__(self, memo):
+        return [deepcopy(value, memo) for value in self]
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+#
+def freeze(value):
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    return value
+#
+_data_cache = {}
+_data_cache_lock = threading.Lock()
+_data_cache_stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+_disk_cache = {'enabled': settings.DATA_CACHE_ENABLED, 'directory': settings.DATA_CACHE_DIRECTORY}
+
+def get_file_signature(fname):
+    stat = os.stat(fname)
+    return (fname, stat.st_mtime_ns, stat.st_size)
+#
+def cached_yaml_data(files_list, loader, *args):
+    '''
+    Parse YAML files once per run and share the read-only result between routers,
+    the key is the path, mtime and size of every file so edited files are re-read
+    '''
+    key = tuple(get_file_signature(fname) for fname in files_list)
+    with _data_cache_lock:
+        if key in _data_cache:
+            _data_cache_stats['memory_hits'] += 1
+            return _data_cache[key]
+    with metrics.timed('yaml_load', files=len(files_list), bytes=sum(signature[2] for signature in key)):
+        if _disk_cache['enabled']:
+            data = disk_cached_yaml_data(files_list, loader, *args)
+        else:
+            data = freeze(loader(*args))
+            count_data_cache('misses')
+    with _data_cache_lock:
+        return _data_cache.setdefault(key, data)
+#
+def clear_data_cache():
+    '''
+    Forget the parsed YAML held in memory and the service index, the next
+    loads read the files (or the disk cache) again
+    '''
+    with _data_cache_lock:
+        _data_cache.clear()
+    _service_index.reset()
+#
+def count_data_cache(counter):
+    with _data_cache_lock:
+        _data_cache_stats[counter] += 1
+#
+def get_content_hash(files_list):
+    content_hash = hashlib.sha256(settings.DATA_CACHE_VERSION.encode())
+    for fname in files_list:
+        with open(fname, 'rb') as infile:
+            content_hash.update(infile.read())
+    return content_hash.hexdigest()
+#
+class CacheUnpickler(pickle.Unpickler):
+    '''
+    Unpickler for the disk cache that only builds what freeze(yaml.safe_load())
+    can produce. The cache directory may be shared between CI pipelines and
+    a plain pickle.load would run any code a poisoned entry asks for.
+    '''
+    allowed = {('variables', 'FrozenDict'): FrozenDict, ('variables', 'FrozenList'): FrozenList,
+               ('datetime', 'date'): datetime.date, ('datetime', 'datetime'): datetime.datetime,
+               ('datetime', 'timedelta'): datetime.timedelta, ('datetime', 'timezone'): datetime.timezone}
+
+    def find_class(self, module, name):
+        try:
+            return self.allowed[(module, name)]
+        except KeyError:
+            raise pickle.UnpicklingError('{0}.{1} is not allowed in the data cache'.format(module, name))
+#
+def disk_cached_yaml_data(files_list, loader, *args):
+    '''
+    Keep the parsed YAML as pickle in the data cache directory between runs,
+    files are only parsed again when their content hash changes
+    '''
+    content_hash = get_content_hash(files_list)
+    cache_file = os.path.join(_disk_cache['directory'], 'data', content_hash[:2], content_hash + '.pickle')
+    try:
+        with open(cache_file, 'rb') as stream:
+            data = CacheUnpickler(stream).load()
+        count_data_cache('disk_hits')
+        return data
+    except FileNotFoundError:
+        pass
+    except Exception as error:
+        logger.warning('Broken data cache file {0}: {1}'.format(cache_file, error))
+    data = freeze(loader(*args))
+    count_data_cache('misses')
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp_cache_file = '{0}.{1}.{2}'.format(cache_file, os.getpid(), threading.get_ident())
+    with open(tmp_cache_file, 'wb') as stream:
+        pickle.dump(data, stream, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_cache_file, cache_file)
+    return data
+#
+def add_data_cache_arguments(parser):
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not read or write the on-disk YAML data cache')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='remove the on-disk YAML data cache before the run')
+#
+def configure_data_cache(args):
+    if args.clear_cache:
+        shutil.rmtree(os.path.join(_disk_cache['directory'], 'data'), ignore_errors=True)
+    if args.no_cache:
+        _disk_cache['enabled'] = False
+#
+def log_data_cache_stats():
+    logger.info('DATA CACHE: {memory_hits} memory hits, {disk_hits} disk hits, {misses} misses'.format(**_data_cache_stats))
+#
+ANY_TEMPLATE = '*.j2'
+_dependencies = {}
+_dependencies_lock = threading.Lock()
+
+def record_dependencies(data, files_list):
+    '''
+    Remember which inputs a router render read, a path ending with / stands
+    for every YAML file directly in that directory
+    '''
+    with _dependencies_lock:
+        _dependencies.setdefault(data['router_hostname'], set()).update(files_list)
+#
+def get_recorded_dependencies(hostname):
+    with _dependencies_lock:
+        return sorted(_dependencies.get(hostname, ()))
+#
+def get_dependencies_file():
+    return os.path.join(settings.DATA_CACHE_DIRECTORY, 'dependencies.json')
+#
+def load_dependencies():
+    try:
+        with open(get_dependencies_file()) as stream:
+            return {hostname: set(files_list) for hostname, files_list in json.load(stream).items()}
+    except FileNotFoundError:
+        return {}
+    except ValueError as error:
+        logger.warning('Broken dependencies file {0}: {1}'.format(get_dependencies_file(), error))
+        return {}
+#
+def save_dependencies():
+    dependencies = load_dependencies()
+    with _dependencies_lock:
+        dependencies.update(_dependencies)
+    dependencies_file = get_dependencies_file()
+    os.makedirs(os.path.dirname(dependencies_file), exist_ok=True)
+    with open(dependencies_file + '.tmp', 'w') as outfile:
+        json.dump({hostname: sorted(files_list) for hostname, files_list in dependencies.items()}, outfile, indent=1)
+    os.replace(dependencies_file + '.tmp', dependencies_file)
+#
+def select_affected_routers(routers, change_set):
+    '''
+    Routers whose recorded inputs changed against the change set base. Routers
+    without a recorded render, routers named in a changed service file and
+    routers with changed .cfg files are always selected.
+    '''
+    changed_files = set(os.path.relpath(os.path.join(change_set.working_tree_dir, changed_file))
+                        for changed_file in change_set.files)
+    if changed_files & set(settings.IMPACT_GLOBAL_FILES):
+        return list(routers)
+    changed_keys = set(changed_files)
+    for changed_file in changed_files:
+        if changed_file.endswith('yaml'):
+            changed_keys.add(os.path.dirname(changed_file) + '/')
+        if changed_file.endswith('.j2'):
+            changed_keys.add(ANY_TEMPLATE)
+    service_keys = set()
+    for changed_file in changed_files:
+        if changed_file.startswith('services/') and changed_file.endswith('yaml') and os.path.exists(changed_file):
+            service_keys |= get_yaml_keys(cached_yaml_data([changed_file], load_yaml_file, changed_file))
+    dependencies = load_dependencies()
+    affected = []
+    for router_data in routers:
+        hostname = router_data['router_hostname']
+        if hostname not in dependencies or hostname in change_set or hostname in service_keys \
+                or not dependencies[hostname].isdisjoint(changed_keys):
+            affected.append(router_data)
+    return affected
+#
+def get_file_path(name, ext, configuration=None, directory=None):
+
+    if not directory:
+        directory = settings.CONFIG_FILES_DIRECTORY
+    filename = os.path.join(directory, name+'.'+ext)
+
+    return filename
+#
+def tryint(s):
+    try:
+        return int(s)
+    except ValueError:
+        return s
+#
+def alphanum_key(s):
+    """ Turn a string into a list of string and number chunks.
+        "z23a" -> ["z", 23, "a"]
+    """
+    return [ tryint(c) for c in re.split('([0-9]+)', s) ]
+#
+def sort_nicely(l):
+    """ Sort the given list in the way that humans expect.
+    """
+    l.sort(key=alphanum_key)
+#
+def get_files_list(mypath, ext='yaml'):
+
+    f = []
+    for (dirpath, dirnames, filenames) in os.walk(mypath):
+        for filename in filenames:
+            if re.search('.*({0})$'.format(ext), filename) is not None:
+                f.append(filename)
+        break
+
+    return f
+#
+def dict_reduce(function, iterable, data):
+    it = iter(iterable)
+    value = next(it)
+    for element in it:
+        value = function(value, element, data)
+    return value
+#
+
+def sort_natural_keys(x):
+    '''
+    Sort the second level keys the way humans expect, interfaces -> type -> name
+    '''
+    _z = OrderedDict()
+    for key in x.keys():
+        list_sorted = sorted(x[key].keys())
+        list_sorted.sort(key=alphanum_key)
+        _z[key] = FrozenDict((name, x[key][name]) for name in list_sorted)
+    return FrozenDict(_z)
+#
+def sort_keys(x):
+    _z = OrderedDict()
+    for key in x.keys():
+        _z[key] = FrozenDict((name, x[key][name]) for name in sorted(x[key].keys()))
+    return FrozenDict(_z)
+#
+def sort_prefix_sets(x):
+    if x.get('prefix_sets'):
+        return sort_keys(x)
+    return x
+#
+_normalizers = OrderedDict()
+
+def register_normalizer(path, function):
+    '''
+    Register function(subtree) -> subtree for the merged data at path,
+    a tuple of keys such as ('routing_policy', 'sets')
+    '''
+    rules = _normalizers
+    for key in path[:-1]:
+        if not isinstance(rules.get(key), dict):
+            rules[key] = OrderedDict()
+        rules = rules[key]
+    rules[path[-1]] = function
+
+register_normalizer(('interfaces',), sort_natural_keys)
+register_normalizer(('routing_policy', 'sets'), sort_prefix_sets)
+#
+def normalize_tree(x, rules):
+    '''
+    Apply the registered normalizers in one pass, only the nodes on a
+    registered path are rebuilt and every other branch is shared
+    '''
+    _z = OrderedDict()
+    for key, value in x.items():
+        rule = rules.get(key)
+        if rule is None or not isinstance(value, dict):
+            _z[key] = value
+        elif callable(rule):
+            _z[key] = rule(value)
+        else:
+            _z[key] = normalize_tree(value, rule)
+    return FrozenDict(_z)
+#
+class check_config_data:
+    def __init__(self,  initial=None, rules=None):
+        self.initial = initial if initial is not None else OrderedDict()
+        self.rules = rules if rules is not None else _normalizers
+        self._z = self.initial
+
+    def get(self):
+        return self._z
+
+    def normalize(self):
+        self._z = normalize_tree(self.initial, self.rules)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('DATA \n{0}'.format(json.dumps(self._z, indent=2)))
+
+#
+def search_for_key(x, y):
+    '''
+    Merge l3vpn trees, subtrees present on one side only are shared, not copied
+    '''
+    z = OrderedDict()
+    overlapping_keys = x.keys() & y.keys()
+    for key in overlapping_keys:
+        try:
+            y[key].keys()
+            x[key].keys()
+            z[key] = search_for_key(x[key], y[key])
+        except:
+            z[key] = freeze(x[key] + y[key])
+    for key in x.keys() - overlapping_keys:
+        z[key] = freeze(x[key])
+    for key in y.keys() - overlapping_keys:
+        z[key] = freeze(y[key])
+    return FrozenDict(z)
+
+#
+def dict_of_dicts_merge(x, y, data):
+    '''
+    Merge two data layers into a new read-only tree. Only the levels where x
+    and y overlap are rebuilt, every other subtree is shared with the inputs.
+    '''
+    z = OrderedDict()
+    overlapping_keys = x.keys() & y.keys()
+    for key in overlapping_keys:
+        if key == 'l3vpn':
+            z[key] = search_for_key(x[key], y[key])
+        elif x[key].get(settings.LIST_MERGE_KEY) or y[key].get(settings.LIST_MERGE_KEY):
+            try:
+                z[key] = freeze(x[key].get(settings.LIST_MERGE_KEY) + y[key].get(settings.LIST_MERGE_KEY))
+            except:
+                try:
+                    z[key] = freeze(x[key] + y[key].get(settings.LIST_MERGE_KEY))
+                except:
+                    z[key] = freeze(x[key].get(settings.LIST_MERGE_KEY) + y[key])
+        else:
+            try:
+                y[key].keys()
+                x[key].keys()
+                z[key] = dict_of_dicts_merge(x[key], y[key], data)
+            except:
+                z[key] = freeze(y[key])
+    for key in x.keys() - overlapping_keys:
+        z[key] = freeze(x[key])
+    for key in y.keys() - overlapping_keys:
+        if key == data['router_hostname']:
+            overlapping_keys = x.keys() & y[key].keys()
+            for o_0 in overlapping_keys:
+                z[o_0] = dict_of_dicts_merge(x[o_0], y[key][o_0], data)
+            for ykey in y[key].keys() - overlapping_keys:
+                z[ykey] = freeze(y[key][ykey])
+        else:
+            z[key] = freeze(y[key])
+    return FrozenDict(z)
+
+
+def get_router_varibles(data):
+## generate configuration from YAMLs
+
+    generic_config_data = get_data_from_directories(data, 'global/')
+    router_specific_config_data = get_data_from_directories(data, 'router_specific/', data['router_hostname'])
+
+    router_specific_service_file_list = get_service_files(data['router_hostname'])
+    record_dependencies(data, router_specific_service_file_list)
+    router_specific_service_data_list = get_data_for_services(data, router_specific_service_file_list)
+
+    merged_config_data_list = []
+    merged_config_data_list.append(generic_config_data)
+    if router_specific_config_data:
+        merged_config_data_list.append(router_specific_config_data)
+    if router_specific_service_data_list:
+        for element in router_specific_service_data_list:
+            merged_config_data_list.append(element)
+
+    with metrics.timed('merge', sources=len(merged_config_data_list)):
+        merged_config_data = dict_reduce(dict_of_dicts_merge, merged_config_data_list, data)
+    checked_config_data = check_config_data(merged_config_data)
+    with metrics.timed('normalize'):
+        checked_config_data.normalize()
+
+    return checked_config_data.get()